@@ -3,6 +3,7 @@ from typing import Optional, Dict, List, Any
 from pydantic import BaseModel
 import json
 import os
+import uuid
 import logging
 import asyncio
 
@@ -12,7 +13,7 @@ from app.tasks.ad_concept_tasks import extract_ad_concept
 from app.tasks.ad_analysis_workflow import analyze_ad_with_structured_workflow
 from app.models.ad_concept import AdConceptOutput
 from app.core.config import settings
-from app.core.redis import get_redis
+from app.services.task_store import AsyncTaskStateStore, get_task_store
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -28,10 +29,13 @@ class StructuredAnalysisResponse(BaseModel):
     error: Optional[str] = None
 
 @router.post("/extract-ad-concept", response_model=TaskResponse)
-async def extract_ad_concept_endpoint(input_data: ExtractAdConceptInput):
+async def extract_ad_concept_endpoint(input_data: ExtractAdConceptInput, store: AsyncTaskStateStore = Depends(get_task_store)):
     """Extract ad concept information from an image URL"""
     task_id = str(uuid.uuid4())
     
+    # Index the task before the worker can pick it up
+    await store.register_task(task_id, "ad-concept", user_id=input_data.user_id)
+    
     # Send task to Celery
     extract_ad_concept.delay(input_data.image_url, task_id)
     
@@ -43,7 +47,8 @@ async def extract_ad_concept_endpoint(input_data: ExtractAdConceptInput):
 @router.post("/analyze-ad-structured", response_model=StructuredAnalysisResponse)
 async def analyze_ad_with_structured_approach(
     request: AnalysisRequest,
-    background_tasks: BackgroundTasks
+    background_tasks: BackgroundTasks,
+    store: AsyncTaskStateStore = Depends(get_task_store)
 ):
     """
     Analyze an advertisement using the structured multi-step workflow approach
@@ -55,18 +60,8 @@ async def analyze_ad_with_structured_approach(
         # Create a background task for the analysis
         async def run_analysis_task():
             try:
-                # Get Redis client
-                redis_client = await get_redis()
-                
                 # Set initial task status
-                await redis_client.set(
-                    f"task:{task_id}", 
-                    json.dumps({
-                        "status": "processing",
-                        "result": None,
-                        "error": None
-                    })
-                )
+                await store.set_status(task_id, "processing")
                 
                 # Run the analysis
                 result = await analyze_ad_with_structured_workflow(
@@ -75,29 +70,14 @@ async def analyze_ad_with_structured_approach(
                 )
                 
                 # Update task status
-                await redis_client.set(
-                    f"task:{task_id}", 
-                    json.dumps({
-                        "status": "completed",
-                        "result": result,
-                        "error": None
-                    })
-                )
+                await store.set_result(task_id, result)
                 
             except Exception as e:
                 # Log the error
                 logger.error(f"Error in structured analysis task {task_id}: {str(e)}")
                 
                 # Update task status with error
-                redis_client = await get_redis()
-                await redis_client.set(
-                    f"task:{task_id}", 
-                    json.dumps({
-                        "status": "failed",
-                        "result": None,
-                        "error": str(e)
-                    })
-                )
+                await store.set_error(task_id, str(e))
         
         # Add the task to background tasks
         background_tasks.add_task(run_analysis_task)
@@ -113,22 +93,16 @@ async def analyze_ad_with_structured_approach(
         raise HTTPException(status_code=500, detail=f"Failed to initiate structured analysis: {str(e)}")
 
 @router.get("/structured-analysis/{task_id}", response_model=StructuredAnalysisResponse)
-async def get_structured_analysis_result(task_id: str):
+async def get_structured_analysis_result(task_id: str, store: AsyncTaskStateStore = Depends(get_task_store)):
     """
     Get the result of a structured analysis task
     """
     try:
-        # Get Redis client
-        redis_client = await get_redis()
-        
-        # Get task data from Redis
-        task_data_str = await redis_client.get(f"task:{task_id}")
-        if not task_data_str:
+        # Get task data from Redis, or the archive once it left Redis
+        task_data = await store.get_with_archive(task_id)
+        if not task_data:
             raise HTTPException(status_code=404, detail=f"Task {task_id} not found")
         
-        # Parse task data
-        task_data = json.loads(task_data_str)
-        
         # Return the task data
         return StructuredAnalysisResponse(
             task_id=task_id,
@@ -1,25 +1,31 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 import uuid
 
 from app.models.ad_recipe import AdRecipeInput
 from app.models.common import TaskResponse
 from app.tasks.ad_recipe_tasks import generate_ad_recipe
 from app.core.config import settings
+from app.services.llm_cache import cache_bypass_requested
+from app.services.task_store import AsyncTaskStateStore, get_task_store
 
 router = APIRouter()
 
 @router.post("/generate-ad-recipe", response_model=TaskResponse)
-async def generate_ad_recipe_endpoint(input_data: AdRecipeInput):
+async def generate_ad_recipe_endpoint(input_data: AdRecipeInput, store: AsyncTaskStateStore = Depends(get_task_store), bypass_cache: bool = Depends(cache_bypass_requested)):
     """Generate an ad recipe by combining ad concept and sales page data"""
     task_id = str(uuid.uuid4())
     
+    # Index the task before the worker can pick it up
+    await store.register_task(task_id, "ad-recipe", user_id=input_data.user_id)
+    
     # Send task to Celery
     generate_ad_recipe.delay(
         input_data.ad_archive_id,
         input_data.image_url, 
         input_data.sales_url,
         input_data.user_id,
-        task_id
+        task_id,
+        bypass_cache=bypass_cache
     )
     
     return TaskResponse(
@@ -4,6 +4,8 @@ from app.api.endpoints.ad_concept import router as ad_concept_router
 from app.api.endpoints.sales_page import router as sales_page_router
 from app.api.endpoints.ad_recipe import router as ad_recipe_router
 from app.api.endpoints.tasks import router as tasks_router
+from app.api.endpoints.usage import router as usage_router
+from app.api.endpoints.rate_limits import router as rate_limits_router
 
 router = APIRouter()
 
@@ -11,4 +13,6 @@ router = APIRouter()
 router.include_router(ad_concept_router)
 router.include_router(sales_page_router)
 router.include_router(ad_recipe_router)
-router.include_router(tasks_router) 
\ No newline at end of file
+router.include_router(tasks_router)
+router.include_router(usage_router)
+router.include_router(rate_limits_router) 
\ No newline at end of file
@@ -0,0 +1,16 @@
+from typing import Any, Dict
+from fastapi import APIRouter, Depends
+
+from app.services.rate_limiter import get_rate_limit_state
+
+router = APIRouter()
+
+@router.get("/rate-limits")
+async def get_rate_limits_endpoint(state: Dict[str, Any] = Depends(get_rate_limit_state)):
+    """
+    Get the shared model rate limiter's current state
+
+    Per model: the effective limits, requests and tokens available right now,
+    how long calls are blocked after a provider 429, and admission counters.
+    """
+    return {"models": state}
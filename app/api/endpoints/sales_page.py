@@ -1,20 +1,25 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 import uuid
 
 from app.models.sales_page import ExtractSalesPageInput
 from app.models.common import TaskResponse
 from app.tasks.sales_page_tasks import extract_sales_page
 from app.core.config import settings
+from app.services.llm_cache import cache_bypass_requested
+from app.services.task_store import AsyncTaskStateStore, get_task_store
 
 router = APIRouter()
 
 @router.post("/extract-sales-page", response_model=TaskResponse)
-async def extract_sales_page_endpoint(input_data: ExtractSalesPageInput):
+async def extract_sales_page_endpoint(input_data: ExtractSalesPageInput, store: AsyncTaskStateStore = Depends(get_task_store), bypass_cache: bool = Depends(cache_bypass_requested)):
     """Extract marketing information from a sales page"""
     task_id = str(uuid.uuid4())
     
+    # Index the task before the worker can pick it up
+    await store.register_task(task_id, "sales-page", user_id=input_data.user_id)
+    
     # Send task to Celery
-    extract_sales_page.delay(input_data.page_url, task_id)
+    extract_sales_page.delay(input_data.page_url, task_id, bypass_cache=bypass_cache)
     
     return TaskResponse(
         task_id=task_id,
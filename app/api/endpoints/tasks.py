@@ -1,73 +1,304 @@
+import re
 import json
-import asyncio
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
-from redis import Redis
-from sse_starlette.sse import EventSourceResponse
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
 
+from app.core import compression
 from app.core.config import settings
+from app.core.streams import stream_manager
+from app.models.common import TaskResult, TaskStatusRequest, TaskStatusResponse
+from app.services.usage import AsyncUsageReader, get_usage_reader
+from app.services.task_store import (
+    AsyncTaskStateStore,
+    get_task_store,
+    task_events_key,
+    user_events_key,
+    TERMINAL_STATUSES,
+)
 
 router = APIRouter()
 
-# Initialize Redis client
-redis_client = Redis(
-    host=settings.REDIS_HOST,
-    port=settings.REDIS_PORT,
-    db=settings.REDIS_DB,
-    socket_timeout=5,
-    socket_connect_timeout=5,
-    retry_on_timeout=True,
-    decode_responses=True
-)
+# Longest single blocking read on a task's event stream; lifetime and idle
+# limits are checked at least this often
+STREAM_BLOCK_MS = 5000
+EVENT_ID_PATTERN = re.compile(r"^\d+-\d+$")
+MAX_MULTIPLEXED_TASKS = 500
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def _too_many_streams() -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"error": "Too many open streams, retry shortly"},
+        headers={"Retry-After": str(settings.SSE_HEARTBEAT_SECONDS)}
+    )
+
+@router.post("/tasks/status", response_model=TaskStatusResponse)
+async def get_task_statuses_endpoint(input_data: TaskStatusRequest, store: AsyncTaskStateStore = Depends(get_task_store)):
+    """Get the status of many tasks in one request"""
+    tasks = await store.get_many(input_data.task_ids, include_result=input_data.include_result)
+    return TaskStatusResponse(tasks=tasks)
+
+# Declared before /tasks/{task_id} so "stream" isn't taken for a task ID
+@router.get("/tasks/stream")
+async def stream_many_tasks(
+    task_ids: Optional[str] = Query(default=None, description="Comma-separated IDs of the tasks to follow"),
+    user_id: Optional[str] = Query(default=None, description="Follow every task started by this user"),
+    store: AsyncTaskStateStore = Depends(get_task_store)
+):
+    """
+    Stream events for several tasks, or for every task of a user, over one SSE connection
+
+    Every event carries the task_id it belongs to. Tasks that already finished
+    are sent once from a snapshot as compact statuses, without their results
+    (fetch those from GET /tasks/{task_id}), so reconnecting is one pipelined
+    read. Only live tasks are followed on their streams, and in user mode
+    newly enqueued tasks are picked up as they start.
+    """
+    requested_ids = [task_id.strip() for task_id in (task_ids or "").split(",") if task_id.strip()]
+    if not requested_ids and not user_id:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "Provide task_ids or user_id"}
+        )
+    if len(requested_ids) > MAX_MULTIPLEXED_TASKS:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"At most {MAX_MULTIPLEXED_TASKS} task_ids can be streamed at once"}
+        )
+
+    lease = stream_manager.acquire()
+    if lease is None:
+        return _too_many_streams()
+
+    async def event_generator():
+        # Stream key -> last delivered ID, and stream key -> task ID for followed tasks
+        cursors = {}
+        followed = {}
+        user_key = None
+
+        # Take the user stream cursor before the snapshot so no new task slips in between
+        candidate_ids = list(requested_ids)
+        if user_id:
+            user_key = user_events_key(user_id)
+            cursors[user_key] = await store.latest_event_id(user_key)
+            candidate_ids.extend(await store.get_user_task_ids(user_id))
+
+        statuses = await store.get_many(candidate_ids)
+        for task_id, entry in statuses.items():
+            status = entry["status"]
+            if status in TERMINAL_STATUSES:
+                # A user may have hundreds of finished tasks; their documents aren't re-read on every reconnect
+                yield {
+                    "event": "update",
+                    "data": json.dumps({"task_id": task_id, **entry})
+                }
+            elif status != "not_found" or task_id in requested_ids:
+                key = task_events_key(task_id)
+                cursors[key] = "0-0"
+                followed[key] = task_id
+
+        # Stop once every explicitly requested task finished; user mode runs until its lifetime ends
+        while cursors:
+            # One blocking read covers every followed stream
+            events = await store.read_streams(cursors, block_ms=STREAM_BLOCK_MS)
+            if not events:
+                yield None
+
+            for key, entry_id, event, data in events:
+                if key not in cursors:
+                    continue
+                cursors[key] = entry_id
+
+                if key == user_key:
+                    # A new task was enqueued for the user, start following it
+                    new_key = task_events_key(data["task_id"])
+                    if new_key not in cursors:
+                        cursors[new_key] = "0-0"
+                        followed[new_key] = data["task_id"]
+                    yield {
+                        "event": "task",
+                        "data": json.dumps(data)
+                    }
+                    continue
+
+                task_id = followed[key]
+                if event == "update":
+                    task_data = await _update_event_data(store, task_id, data)
+                    yield {
+                        "event": "update",
+                        "data": json.dumps({"task_id": task_id, **task_data})
+                    }
+
+                    # Finished tasks emit nothing more
+                    if data.get("status") in TERMINAL_STATUSES:
+                        del cursors[key]
+                else:
+                    yield {
+                        "event": event,
+                        "data": json.dumps({"task_id": task_id, **data})
+                    }
+
+    return stream_manager.response(lease, event_generator(), stream_manager.lifetime_for("multiplex"))
 
-# For debugging
-print(f"[API] Connecting to Redis at {settings.REDIS_HOST}:{settings.REDIS_PORT}")
+def _etag_matches(if_none_match: Optional[str], etags: List[str]) -> bool:
+    """Whether an If-None-Match header matches any of the given entity tags"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(etag in candidates for etag in etags)
 
 @router.get("/tasks/{task_id}")
-async def get_task_result_endpoint(task_id: str):
-    """Get the result of a task by its ID"""
-    task_result = redis_client.get(f"task:{task_id}")
+async def get_task_result_endpoint(task_id: str, request: Request, store: AsyncTaskStateStore = Depends(get_task_store)):
+    """
+    Get the result of a task by its ID
+
+    Responses carry a strong ETag derived from the task's version, so polling
+    clients sending If-None-Match get a 304 without the payload being read.
+    Completed results never change and are marked immutable for caches;
+    a completed task whose document can't be found is sent uncacheable.
+    """
+    meta = await store.get_meta(task_id)
+    
+    if meta is None:
+        task_result = await store.get_archived(task_id)
+        if not task_result:
+            return JSONResponse(
+                status_code=404,
+                content={"error": "Task not found"},
+                headers={"Cache-Control": "no-store"}
+            )
+        version = "archived"
+    else:
+        task_result = None
+        version = meta.get("version", "0")
+    
+    status = meta["status"] if meta else task_result.get("status")
+    base_etag = f'"{task_id}.{version}"'
+    headers = {
+        "ETag": base_etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if status == "completed" else "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    
+    # Compressed bodies are a different representation, so they get their own tag
+    etags = [base_etag] + [f'"{task_id}.{version}.{encoding}"' for encoding in compression.HTTP_ENCODINGS.values()]
+    if _etag_matches(request.headers.get("If-None-Match"), etags):
+        return Response(status_code=304, headers=headers)
+    
+    if task_result is not None:
+        return JSONResponse(content=task_result, headers=headers)
+    
+    if status == "completed":
+        document = await store.get_document(task_id)
+        if document is not None:
+            # Stored documents are already JSON, so they are sent without re-parsing,
+            # and still compressed when the client accepts the codec
+            encoding, body = compression.split(document)
+            if encoding and compression.accepts_encoding(request.headers.get("Accept-Encoding"), encoding):
+                headers["Content-Encoding"] = encoding
+                headers["ETag"] = f'"{task_id}.{version}.{encoding}"'
+            else:
+                body = compression.decompress(document)
+            return Response(content=body, media_type="application/json", headers=headers)
+        # The result left Redis before its metadata (or was reset by a redelivery)
+        archived = await store.get_archived(task_id)
+        if archived is not None:
+            return JSONResponse(content=archived, headers=headers)
     
-    if not task_result:
+    # Only an actual result document may be cached as immutable
+    if status == "completed":
+        headers["Cache-Control"] = "no-store"
+    return JSONResponse(
+        content=TaskResult(status=status, error=meta.get("error")).model_dump(),
+        headers=headers
+    )
+
+async def _update_event_data(store: AsyncTaskStateStore, task_id: str, update: dict) -> dict:
+    """Build the TaskResult payload sent to clients for a status update event"""
+    if update.get("status") == "completed":
+        # Only completed tasks carry a document worth fetching
+        task_data = await store.get_with_archive(task_id)
+        if task_data and task_data.get("status") == "completed":
+            return task_data
+    return TaskResult(status=update.get("status", "unknown"), error=update.get("error")).model_dump()
+
+@router.get("/tasks/{task_id}/usage")
+async def get_task_usage_endpoint(task_id: str, reader: AsyncUsageReader = Depends(get_usage_reader)):
+    """
+    Get the tokens, retries, wall time and estimated cost of the model calls made by a task
+
+    Also returns, per agent, the cascade of models tried and why each was
+    accepted or escalated.
+    """
+    task_usage = await reader.get_task_usage(task_id)
+    if task_usage is None:
         return JSONResponse(
             status_code=404,
             content={"error": "Task not found"}
         )
-    
-    return json.loads(task_result)
+    return {"task_id": task_id, **task_usage}
 
 @router.get("/tasks/{task_id}/stream")
-async def stream_task_result(task_id: str):
-    """Stream task results using Server-Sent Events"""
+async def stream_task_result(task_id: str, request: Request, store: AsyncTaskStateStore = Depends(get_task_store)):
+    """
+    Stream task status and progress events using Server-Sent Events
+
+    Events are replayed from the task's Redis stream and carry their stream
+    ID, so a client reconnecting with Last-Event-ID resumes where it left off.
+    """
+    last_event_id = request.headers.get("Last-Event-ID", "")
+    resuming = bool(EVENT_ID_PATTERN.match(last_event_id))
+
+    lifetime = stream_manager.lifetime_for(await store.get_task_type(task_id))
+    lease = stream_manager.acquire()
+    if lease is None:
+        return _too_many_streams()
+
     async def event_generator():
-        # Initial delay to allow task to be registered
-        await asyncio.sleep(0.5)
-        
-        # Check for 60 seconds (adjust as needed)
-        for _ in range(120):  # 120 * 0.5s = 60s
-            task_result = redis_client.get(f"task:{task_id}")
-            
-            if task_result:
-                task_data = json.loads(task_result)
-                
-                # Send the current state as an event
-                yield {
-                    "event": "update",
-                    "data": task_result
-                }
-                
-                # If the task is completed or failed, stop streaming
-                if task_data.get("status") in ["completed", "failed"]:
-                    break
-            
-            # Wait before checking again
-            await asyncio.sleep(0.5)
-        
-        # Send a final event if we time out
-        if not task_result or json.loads(task_result).get("status") not in ["completed", "failed"]:
+        last_id = last_event_id if resuming else "0-0"
+        events = await store.read_events(task_id, last_id)
+
+        # Without events to replay (nothing new, or the stream expired or was trimmed,
+        # even under a resuming client) send one snapshot, from the archive if the
+        # task already left Redis
+        if not events:
+            task_data = await store.get_with_archive(task_id)
+            # Unknown tasks get no events; finished ones have nothing more to send
+            if not task_data:
+                return
             yield {
-                "event": "timeout",
-                "data": json.dumps({"status": "timeout", "error": "Task processing timed out"})
+                "event": "update",
+                "data": json.dumps(task_data)
             }
-    
-    return EventSourceResponse(event_generator()) 
\ No newline at end of file
+
+            if task_data.get("status") in TERMINAL_STATUSES:
+                return
+
+        while True:
+            for entry_id, event, data in events:
+                last_id = entry_id
+
+                if event == "update":
+                    yield {
+                        "id": entry_id,
+                        "event": "update",
+                        "data": json.dumps(await _update_event_data(store, task_id, data))
+                    }
+
+                    # If the task is completed or failed, stop streaming
+                    if data.get("status") in TERMINAL_STATUSES:
+                        return
+                else:
+                    yield {
+                        "id": entry_id,
+                        "event": event,
+                        "data": json.dumps(data)
+                    }
+
+            # Block on the stream until new events arrive instead of polling
+            events = await store.read_events(task_id, last_id, block_ms=STREAM_BLOCK_MS)
+            if not events:
+                yield None
+
+    return stream_manager.response(lease, event_generator(), lifetime)
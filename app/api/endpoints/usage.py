@@ -0,0 +1,41 @@
+import re
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import JSONResponse
+
+from app.services.llm_cache import get_llm_cache_stats
+from app.services.usage import AsyncUsageReader, get_usage_reader, USAGE_DIMENSIONS
+
+router = APIRouter()
+
+DAY_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+# Declared before /usage/{dimension} so "cache" isn't taken for a dimension
+@router.get("/usage/cache")
+async def get_cache_stats(stats: Dict[str, Any] = Depends(get_llm_cache_stats)):
+    """Get model result cache hits, misses, bypasses and hit rate per agent, and the number of cached entries"""
+    return stats
+
+@router.get("/usage/{dimension}")
+async def get_usage_totals(
+    dimension: str,
+    day: Optional[str] = Query(default=None, description="UTC day (YYYY-MM-DD) to report instead of all-time totals"),
+    reader: AsyncUsageReader = Depends(get_usage_reader)
+):
+    """
+    Get model usage totals per task type, user or model
+
+    Each entry carries calls, requests, input/output/cached tokens, retries,
+    failures, cache hits, wall time in seconds and estimated cost in USD.
+    """
+    if dimension not in USAGE_DIMENSIONS:
+        return JSONResponse(
+            status_code=404,
+            content={"error": f"Unknown usage dimension, use one of: {', '.join(USAGE_DIMENSIONS)}"}
+        )
+    if day is not None and not DAY_PATTERN.match(day):
+        return JSONResponse(
+            status_code=400,
+            content={"error": "day must be formatted as YYYY-MM-DD"}
+        )
+    return {"dimension": dimension, "day": day, "usage": await reader.get_totals(dimension, day)}
@@ -9,7 +9,7 @@ celery_app = Celery(
     broker_url=settings.CELERY_BROKER_URL,
     result_backend=settings.CELERY_RESULT_BACKEND,
     broker_transport_options={
-        'visibility_timeout': 3600,
+        'visibility_timeout': settings.CELERY_VISIBILITY_TIMEOUT,
         'fanout_prefix': True,
         'fanout_patterns': True,
         'socket_connect_timeout': 5,
@@ -32,6 +32,14 @@ celery_app.conf.update(
     task_track_started=True,
     result_expires=3600,  # 1 hour
     broker_connection_retry_on_startup=True,
+    # Acknowledge only once a task finished, so tasks in flight when a worker
+    # dies or is drained are redelivered instead of lost
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    # Each slot reserves one message; a busy worker doesn't hoard the queue
+    worker_prefetch_multiplier=1,
+    worker_pool=settings.WORKER_POOL,
+    worker_concurrency=settings.WORKER_CONCURRENCY,
 )
 
 # Import tasks modules to register tasks with Celery
@@ -0,0 +1,80 @@
+import zlib
+from typing import Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, zlib is always available
+    zstandard = None
+
+from app.core.config import settings
+
+# Compressed payloads start with a NUL byte followed by a codec byte. JSON
+# documents never start with NUL, so uncompressed payloads carry no header.
+ZLIB_HEADER = b"\x00z"
+ZSTD_HEADER = b"\x00s"
+
+# HTTP Content-Encoding matching each codec's raw output: zlib's format is
+# exactly what HTTP calls "deflate"
+HTTP_ENCODINGS = {
+    ZLIB_HEADER: "deflate",
+    ZSTD_HEADER: "zstd",
+}
+
+def _codec() -> bytes:
+    codec = settings.TASK_COMPRESSION_CODEC
+    if codec == "zstd" or (codec == "auto" and zstandard is not None):
+        if zstandard is None:
+            raise RuntimeError("TASK_COMPRESSION_CODEC is zstd but the zstandard package is not installed")
+        return ZSTD_HEADER
+    return ZLIB_HEADER
+
+def compress(data: bytes) -> bytes:
+    """Compress a payload with a codec header when it is above the size threshold"""
+    if len(data) < settings.TASK_COMPRESSION_MIN_BYTES:
+        return data
+    header = _codec()
+    if header == ZSTD_HEADER:
+        return header + zstandard.ZstdCompressor(level=3).compress(data)
+    return header + zlib.compress(data, 6)
+
+def split(data: bytes) -> Tuple[Optional[str], bytes]:
+    """Split a stored payload into its HTTP content encoding (None if raw) and body"""
+    header = data[:2]
+    if header in HTTP_ENCODINGS:
+        return HTTP_ENCODINGS[header], data[2:]
+    return None, data
+
+def decompress(data: bytes) -> bytes:
+    """Return the original bytes of a payload written by compress()"""
+    encoding, body = split(data)
+    if encoding == "deflate":
+        return zlib.decompress(body)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Found a zstd payload but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(body)
+    return body
+
+def accepts_encoding(accept_encoding: Optional[str], encoding: str) -> bool:
+    """
+    Whether an Accept-Encoding header allows the given content encoding
+
+    The encoding's own entry wins over a "*" wildcard wherever either
+    appears, so "*, zstd;q=0" refuses zstd.
+    """
+    qualities = {}
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if name not in (encoding, "*") or name in qualities:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    return qualities.get(encoding, qualities.get("*", 0.0)) > 0
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Any, Dict, List, Optional
 import os
 
 class Settings(BaseSettings):
@@ -9,10 +9,141 @@ class Settings(BaseSettings):
     # OpenAI API Key should be set in environment variables
     OPENAI_API_KEY: Optional[str] = os.environ.get("OPENAI_API_KEY")
     
+    # Model used by the worker agents, and the pooled HTTP client they share.
+    # Timeouts are in seconds.
+    AGENT_MODEL: str = "gpt-4o"
+    # Models tried in order per agent: cheaper first, escalating only when the
+    # output fails validation or the agent's completeness check. Agents not
+    # listed use AGENT_MODEL alone; "test" is an offline stub model.
+    AGENT_CASCADES: Dict[str, List[str]] = {
+        "sales_page": ["gpt-4o-mini", "gpt-4o"],
+        "sales_page_narrative": ["gpt-4o-mini", "gpt-4o"],
+        "sales_page_chunk": ["gpt-4o-mini"],
+        "ad_concept_fallback": ["gpt-4o"],
+    }
+    # "openai" calls the real API; "offline" answers every model with
+    # schema-valid fixtures after a latency drawn per model from
+    # OFFLINE_MODEL_LATENCY ("lognormal" with median/sigma, "uniform" with
+    # min/max, or "fixed" seconds), for benchmarking without network access
+    MODEL_PROVIDER: str = "openai"
+    OFFLINE_MODEL_LATENCY: Dict[str, Dict[str, Any]] = {
+        "gpt-4o-mini": {"distribution": "lognormal", "median": 1.5, "sigma": 0.4},
+        "gpt-4o": {"distribution": "lognormal", "median": 4.0, "sigma": 0.5},
+        "default": {"distribution": "lognormal", "median": 2.0, "sigma": 0.5},
+    }
+    OFFLINE_MODEL_ERROR_RATE: float = 0.0
+    OFFLINE_MODEL_INVALID_RATE: float = 0.0
+    MODEL_HTTP_TIMEOUT: float = 120.0
+    MODEL_HTTP_MAX_CONNECTIONS: int = 50
+    MODEL_HTTP_MAX_KEEPALIVE: int = 20
+    MODEL_HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    # Shared cache of validated model outputs, keyed by model, prompt and input
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_TTL: int = 7 * 24 * 60 * 60
+    LLM_CACHE_MAX_ENTRIES: int = 50000
+    # Coalesce identical model calls running at the same time across workers.
+    # The leader's lock lease is renewed while it works and expires after
+    # SINGLE_FLIGHT_LOCK_TTL seconds if its worker dies.
+    SINGLE_FLIGHT_ENABLED: bool = True
+    SINGLE_FLIGHT_LOCK_TTL: int = 30
+    SINGLE_FLIGHT_WAIT_TIMEOUT: float = 600.0
+    SINGLE_FLIGHT_RESULT_TTL: int = 60
+    
+    # Extracted sales pages by normalized URL: served as-is while fresh, served
+    # while refreshed in the background once stale, dropped after the max stale age
+    SALES_PAGE_CACHE_FRESH_SECONDS: int = 6 * 60 * 60
+    SALES_PAGE_CACHE_MAX_STALE_SECONDS: int = 7 * 24 * 60 * 60
+    SALES_PAGE_REFRESH_LOCK_SECONDS: int = 10 * 60
+    # Sales pages are downloaded and reduced to their main content before
+    # extraction; PAGE_FETCH_MAX_BYTES caps the downloaded HTML, and the
+    # highest-ranked sections are packed into SALES_PAGE_TOKEN_BUDGET tokens
+    PAGE_FETCH_TIMEOUT: float = 20.0
+    PAGE_FETCH_MAX_BYTES: int = 3 * 1024 * 1024
+    PAGE_FETCH_MAX_CONNECTIONS: int = 50
+    PAGE_FETCH_USER_AGENT: str = "Mozilla/5.0 (compatible; EcomAIServices/1.0)"
+    SALES_PAGE_TOKEN_BUDGET: int = 6000
+    # Pages longer than SALES_PAGE_MAP_REDUCE_THRESHOLD tokens are condensed to
+    # at most SALES_PAGE_MAX_CHUNKS chunks of SALES_PAGE_CHUNK_TOKENS, extracted
+    # in parallel and merged
+    SALES_PAGE_MAP_REDUCE_THRESHOLD: int = 24000
+    SALES_PAGE_CHUNK_TOKENS: int = 6000
+    SALES_PAGE_MAX_CHUNKS: int = 6
+    # Read product name, price and ratings from JSON-LD, OpenGraph and
+    # microdata, and ask the model only for the remaining narrative fields
+    SALES_PAGE_STRUCTURED_FAST_PATH: bool = True
+    # Provider quotas shared by every worker, per model. Workers take capacity
+    # from Redis token buckets sized at RATE_LIMIT_HEADROOM of these before
+    # each call; models not listed are not limited.
+    MODEL_RATE_LIMITS: Dict[str, Dict[str, int]] = {
+        "gpt-4o": {"rpm": 500, "tpm": 30000},
+        "gpt-4o-mini": {"rpm": 500, "tpm": 200000},
+    }
+    RATE_LIMIT_HEADROOM: float = 0.9
+    RATE_LIMIT_JITTER: float = 0.2
+    RATE_LIMIT_MAX_WAIT_SECONDS: float = 300.0
+    RATE_LIMIT_MAX_RETRIES: int = 4
+    RATE_LIMIT_BACKOFF_BASE: float = 1.0
+    # Token estimates for each image and for the output of a call
+    RATE_LIMIT_IMAGE_TOKENS: int = 1000
+    RATE_LIMIT_OUTPUT_TOKENS: int = 1500
+    
+    # Model prices in USD per million tokens, used to estimate the cost of each task
+    MODEL_PRICES: Dict[str, Dict[str, float]] = {
+        "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+        "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    }
+    # Longest a task waits on a coroutine submitted to the worker event loop
+    WORKER_COROUTINE_TIMEOUT: float = 600.0
+    
+    # Celery worker mode. "threads" runs WORKER_CONCURRENCY tasks in one process,
+    # all awaiting the model on the shared worker event loop; "prefork" runs one
+    # process per task. Unacknowledged tasks are redelivered after
+    # CELERY_VISIBILITY_TIMEOUT seconds, so keep it above WORKER_COROUTINE_TIMEOUT.
+    WORKER_POOL: str = "threads"
+    WORKER_CONCURRENCY: int = 50
+    WORKER_QUEUES: str = "ad-concept,sales-page,ad-recipe"
+    CELERY_VISIBILITY_TIMEOUT: int = 3600
+    
     # Redis settings
     REDIS_HOST: str = "redis"
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
+    REDIS_PASSWORD: Optional[str] = None
+    
+    # Size of the shared asyncio pool used by the API, and how long a request
+    # waits for a free connection before failing
+    REDIS_MAX_CONNECTIONS: int = 300
+    REDIS_POOL_TIMEOUT: float = 5.0
+    
+    # Server-Sent Events limits. Every open stream holds a pooled Redis
+    # connection while it waits for events, so keep SSE_MAX_STREAMS below
+    # REDIS_MAX_CONNECTIONS.
+    SSE_MAX_STREAMS: int = 250
+    SSE_HEARTBEAT_SECONDS: int = 15
+    SSE_IDLE_TIMEOUT_SECONDS: int = 300
+    SSE_SEND_TIMEOUT_SECONDS: int = 30
+    # Maximum stream lifetime in seconds per task type ("multiplex" for /tasks/stream)
+    SSE_STREAM_LIFETIMES: Dict[str, int] = {
+        "ad-concept": 300,
+        "sales-page": 300,
+        "ad-recipe": 900,
+        "multiplex": 3600,
+        "default": 300,
+    }
+    
+    # How long (in seconds) task records stay in Redis after entering each status
+    TASK_TTL_PROCESSING: int = 2 * 60 * 60
+    TASK_TTL_COMPLETED: int = 24 * 60 * 60
+    TASK_TTL_FAILED: int = 24 * 60 * 60
+    
+    # Task documents at least this large are stored compressed in Redis with
+    # TASK_COMPRESSION_CODEC: "auto" (zstd when installed, else zlib), "zstd" or "zlib"
+    TASK_COMPRESSION_MIN_BYTES: int = 2048
+    TASK_COMPRESSION_CODEC: str = "auto"
+    
+    # Cold tier for completed results once they leave Redis: "sqlite", "supabase" or "none"
+    TASK_ARCHIVE_BACKEND: str = "sqlite"
+    TASK_ARCHIVE_SQLITE_PATH: str = "data/task_archive.db"
     
     # Supabase settings
     SUPABASE_URL: Optional[str] = os.environ.get("SUPABASE_URL")
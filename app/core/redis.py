@@ -0,0 +1,73 @@
+import logging
+from typing import Optional
+
+from redis import Redis
+from redis import asyncio as aioredis
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Shared asyncio connection pool, created once per API process in the app lifespan
+_pool: Optional[aioredis.BlockingConnectionPool] = None
+_client: Optional[aioredis.Redis] = None
+
+def create_redis_pool() -> aioredis.BlockingConnectionPool:
+    """
+    Create an asyncio Redis connection pool sized from settings
+
+    Replies are left as bytes so compressed task documents can be passed
+    through to clients untouched; callers decode text values themselves.
+    """
+    return aioredis.BlockingConnectionPool(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        password=settings.REDIS_PASSWORD,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        socket_connect_timeout=5,
+        retry_on_timeout=True,
+        health_check_interval=30
+    )
+
+async def init_redis_pool() -> aioredis.Redis:
+    """Create the shared pool and client if they don't exist yet"""
+    global _pool, _client
+    if _client is None:
+        _pool = create_redis_pool()
+        _client = aioredis.Redis(connection_pool=_pool)
+        logger.info(
+            f"Redis pool ready at {settings.REDIS_HOST}:{settings.REDIS_PORT} "
+            f"(max_connections={settings.REDIS_MAX_CONNECTIONS})"
+        )
+    return _client
+
+async def close_redis_pool():
+    """Close the shared client and release every pooled connection"""
+    global _pool, _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+    if _pool is not None:
+        await _pool.disconnect()
+        _pool = None
+
+async def get_redis() -> aioredis.Redis:
+    """FastAPI dependency returning the shared asyncio Redis client"""
+    # Fall back to lazy creation when running outside the app lifespan
+    if _client is None:
+        return await init_redis_pool()
+    return _client
+
+def create_sync_redis() -> Redis:
+    """Create a synchronous Redis client for worker code, returning bytes like the async pool"""
+    return Redis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        password=settings.REDIS_PASSWORD,
+        socket_timeout=5,
+        socket_connect_timeout=5,
+        retry_on_timeout=True
+    )
@@ -0,0 +1,126 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Callable, List, Optional
+
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown, worker_shutdown
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class WorkerRuntime:
+    """
+    One long-lived event loop per worker process, running in its own thread
+
+    Celery tasks are synchronous, so they hand coroutines to this loop and
+    wait for the result. Because the loop outlives individual tasks, clients
+    bound to it (HTTP connection pools, keep-alive) are reused across tasks.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._shutdown_hooks: List[Callable[[], Awaitable[None]]] = []
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        self.start()
+        return self._loop
+
+    def start(self):
+        """Start the loop thread unless this process already runs one"""
+        with self._lock:
+            # A loop inherited through fork has no thread behind it in the child
+            if self._loop is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            self._loop = loop
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=run, name="worker-event-loop", daemon=True)
+            self._thread.start()
+            ready.wait()
+            logger.info(f"Started worker event loop in process {self._pid}")
+
+    def on_shutdown(self, hook: Callable[[], Awaitable[None]]):
+        """Register a coroutine function awaited on the loop before it stops, e.g. to close clients"""
+        self._shutdown_hooks.append(hook)
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run a coroutine on the worker loop and wait for its result
+
+        Raises TimeoutError after `timeout` seconds (settings.WORKER_COROUTINE_TIMEOUT
+        by default), cancelling the coroutine so it doesn't keep running unobserved.
+        """
+        if timeout is None:
+            timeout = settings.WORKER_COROUTINE_TIMEOUT
+        loop = self.loop
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("WorkerRuntime.run() would block its own event loop; await the coroutine instead")
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Coroutine did not finish within {timeout} seconds")
+        except BaseException:
+            # Also covers the calling thread being interrupted while waiting
+            future.cancel()
+            raise
+
+    def stop(self, timeout: float = 10.0):
+        """Cancel outstanding work and stop the loop thread"""
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                return
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = self._pid = None
+
+        async def shutdown():
+            for hook in self._shutdown_hooks:
+                try:
+                    await hook()
+                except Exception as e:
+                    logger.warning(f"Error in worker shutdown hook: {str(e)}")
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await loop.shutdown_asyncgens()
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=timeout)
+        except Exception as e:
+            logger.warning(f"Error shutting down worker event loop: {str(e)}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=timeout)
+        if not thread.is_alive():
+            loop.close()
+
+# Create a singleton instance for this process
+worker_runtime = WorkerRuntime()
+
+# Prefork children get the process signals; the threads pool runs tasks in
+# the main process, which only gets the worker signals. The PID check in
+# start() keeps a parent's loop from being reused in its children.
+@worker_init.connect
+@worker_process_init.connect
+def start_worker_runtime(**kwargs):
+    worker_runtime.start()
+
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def stop_worker_runtime(**kwargs):
+    worker_runtime.stop()
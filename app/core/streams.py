@@ -0,0 +1,94 @@
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Dict, Optional
+
+from sse_starlette.sse import EventSourceResponse
+from starlette.background import BackgroundTask
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class StreamLease:
+    """A slot held by one SSE connection, released exactly once"""
+
+    def __init__(self, manager: "StreamManager"):
+        self.manager = manager
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.manager._active -= 1
+
+class StreamManager:
+    """
+    Tracks the SSE connections served by this process and enforces their limits
+
+    Event sources are async generators yielding SSE event dicts, or None after
+    a read that produced nothing, which lets the manager check lifetime and
+    idleness without the source knowing about either. Heartbeat comments and
+    eviction of clients that stop reading are left to sse-starlette.
+    """
+
+    def __init__(self, max_streams: int):
+        self.max_streams = max_streams
+        self._active = 0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def acquire(self) -> Optional[StreamLease]:
+        """Reserve a slot for a new stream, or None when the process is at its cap"""
+        if self._active >= self.max_streams:
+            logger.warning(f"Rejecting SSE connection, {self._active}/{self.max_streams} streams open")
+            return None
+        self._active += 1
+        return StreamLease(self)
+
+    def lifetime_for(self, task_type: Optional[str]) -> int:
+        """Maximum lifetime in seconds of a stream following a task of this type"""
+        lifetimes = settings.SSE_STREAM_LIFETIMES
+        return lifetimes.get(task_type or "default", lifetimes.get("default", 300))
+
+    async def _supervise(self, lease: StreamLease, events: AsyncIterator[Optional[Dict]], lifetime: float) -> AsyncIterator[Dict]:
+        loop = asyncio.get_running_loop()
+        started = last_activity = loop.time()
+        try:
+            async for event in events:
+                now = loop.time()
+                if event is not None:
+                    last_activity = now
+                    yield event
+
+                if now - started >= lifetime:
+                    error = "Task processing timed out"
+                elif now - last_activity >= settings.SSE_IDLE_TIMEOUT_SECONDS:
+                    error = "No task activity, closing idle stream"
+                else:
+                    continue
+
+                # Send a final event when the stream outlives its budget
+                yield {
+                    "event": "timeout",
+                    "data": json.dumps({"status": "timeout", "error": error})
+                }
+                return
+        finally:
+            await events.aclose()
+            lease.release()
+
+    def response(self, lease: StreamLease, events: AsyncIterator[Optional[Dict]], lifetime: float) -> EventSourceResponse:
+        """Serve an event source under this manager's heartbeat, lifetime and idle limits"""
+        return EventSourceResponse(
+            self._supervise(lease, events, lifetime),
+            ping=settings.SSE_HEARTBEAT_SECONDS,
+            send_timeout=settings.SSE_SEND_TIMEOUT_SECONDS,
+            # Releases the slot even if the generator never got to run
+            background=BackgroundTask(lease.release)
+        )
+
+# Create a singleton instance for this process
+stream_manager = StreamManager(settings.SSE_MAX_STREAMS)
@@ -1,9 +1,18 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.api import api_router
 from app.core.config import settings
+from app.core.redis import init_redis_pool, close_redis_pool
 
-app = FastAPI(title=settings.PROJECT_NAME)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One Redis pool per API process, shared by every endpoint
+    await init_redis_pool()
+    yield
+    await close_redis_pool()
+
+app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -4,6 +4,7 @@ from typing import Dict, List, Any, Optional
 class ExtractAdConceptInput(BaseModel):
     """Input for ad concept extraction with image URL"""
     image_url: str = Field(..., description="URL to the image to analyze")
+    user_id: Optional[str] = Field(default=None, description="ID of the user making the request")
 
 class AdConceptOutput(BaseModel):
     """Output model for ad concept extraction with a more flexible structure"""
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Dict, Optional
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
 
 class TaskResponse(BaseModel):
     task_id: str
@@ -8,4 +8,13 @@ class TaskResponse(BaseModel):
 class TaskResult(BaseModel):
     status: str
     result: Optional[Dict] = None
-    error: Optional[str] = None 
\ No newline at end of file
+    error: Optional[str] = None
+
+class TaskStatusRequest(BaseModel):
+    """Input for looking up the status of many tasks at once"""
+    task_ids: List[str] = Field(..., min_length=1, max_length=500, description="IDs of the tasks to look up")
+    include_result: bool = Field(default=False, description="Include the result body of completed tasks")
+
+class TaskStatusResponse(BaseModel):
+    """Compact status map keyed by task ID, with not_found for unknown IDs"""
+    tasks: Dict[str, Dict[str, Any]]
@@ -3,6 +3,7 @@ from typing import Dict, List, Any, Optional
 
 class ExtractSalesPageInput(BaseModel):
     page_url: str = Field(..., description="URL to the sales page to analyze")
+    user_id: Optional[str] = Field(default=None, description="ID of the user making the request")
 
 class SalesPageOutput(BaseModel):
     """Output model for sales page extraction with more flexible field requirements"""
@@ -23,4 +24,30 @@ class SalesPageOutput(BaseModel):
     additional_info: Optional[Dict[str, Any]] = Field(
         default_factory=dict,
         description="Any additional information not covered by other fields"
-    ) 
\ No newline at end of file
+    )
+
+class SalesPageChunkOutput(SalesPageOutput):
+    """Partial extraction from one chunk of a long sales page"""
+    product_name: str = Field(default="", description="Name of the product, if this part of the page shows it")
+    confidence: Dict[str, float] = Field(
+        default_factory=dict,
+        description="Confidence from 0 to 1 for each field filled from this part of the page"
+    )
+
+class SalesPageNarrativeOutput(BaseModel):
+    """The sales page fields structured data can't provide, extracted from the page copy"""
+    tagline: str = Field(default="", description="Main tagline or slogan")
+    key_benefits: List[str] = Field(default_factory=list, description="Key benefits of the product")
+    features: List[str] = Field(default_factory=list, description="Product features")
+    problem_addressed: str = Field(default="", description="Problem the product addresses")
+    target_audience: str = Field(default="", description="Target audience description")
+    offer: Dict[str, str] = Field(default_factory=dict, description="Discount, limited_time_offer, shipping and guarantee terms, without the price")
+    call_to_action: str = Field(default="", description="Call to action text")
+    visual_elements_to_include: List[str] = Field(default_factory=list, description="Visual elements to include in ads")
+    brand_voice: str = Field(default="", description="Brand voice description")
+    compliance_notes: str = Field(default="", description="Compliance notes")
+    # Left out when the page's structured data already has ratings or reviews
+    social_proof: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Only when asked: testimonials and media_mentions (arrays) and sales_numbers claimed on the page"
+    )
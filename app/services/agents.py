@@ -0,0 +1,431 @@
+import contextvars
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+from celery.signals import worker_init, worker_process_init
+from pydantic import BaseModel, ValidationError
+from pydantic_ai import Agent, RunContext
+from pydantic_ai.exceptions import UnexpectedModelBehavior
+from pydantic_ai.models import Model
+from pydantic_ai.models.test import TestModel
+from pydantic_ai.models.openai import OpenAIModel
+from pydantic_ai.providers.openai import OpenAIProvider
+
+from app.core.config import settings
+from app.core.runtime import worker_runtime
+from app.services.llm_cache import cache_key, llm_cache
+from app.services.offline_models import build_offline_model
+from app.services.rate_limiter import rate_limiter, retry_after_from
+from app.services.usage import summarize_run, usage_tracker
+from app.models.ad_concept import AdConceptOutput
+from app.models.sales_page import SalesPageChunkOutput, SalesPageNarrativeOutput, SalesPageOutput
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SALES_PAGE_SYSTEM_PROMPT = """You are an expert marketing assistant. Analyze the following sales page and extract all the essential information needed for an advertiser to create effective Facebook ad creatives. Organize the information into a structured JSON format.
+
+Your analysis MUST include these fields in JSON format:
+- product_name: The name of the product (required)
+- tagline: Main tagline or slogan
+- key_benefits: Array of key benefits of the product
+- features: Array of product features
+- problem_addressed: Problem the product addresses
+- target_audience: Target audience description
+- social_proof: Object containing testimonials (array), media_mentions (array), and sales_numbers (string)
+- offer: Object containing discount, limited_time_offer, shipping, and guarantee details
+- call_to_action: Call to action text
+- visual_elements_to_include: Array of visual elements to include in ads
+- brand_voice: Brand voice description
+- compliance_notes: Any compliance or legal considerations
+
+The output JSON MUST match this structure:
+{
+  "product_name": "Example Product",
+  "tagline": "Revolutionize Your Experience",
+  "key_benefits": ["Benefit 1", "Benefit 2", "Benefit 3"],
+  "features": ["Feature 1", "Feature 2", "Feature 3"],
+  "problem_addressed": "Description of the problem this product solves",
+  "target_audience": "Description of the target audience",
+  "social_proof": {
+    "testimonials": ["Testimonial 1", "Testimonial 2"],
+    "media_mentions": ["Media mention 1", "Media mention 2"],
+    "sales_numbers": "Over 10,000 satisfied customers"
+  },
+  "offer": {
+    "discount": "20% off",
+    "limited_time_offer": "Only available until Friday",
+    "shipping": "Free shipping worldwide",
+    "guarantee": "30-day money-back guarantee"
+  },
+  "call_to_action": "Get yours today",
+  "visual_elements_to_include": ["Product image", "Customer testimonial image", "Before/after comparison"],
+  "brand_voice": "Professional but approachable, emphasizes expertise",
+  "compliance_notes": "Must include disclaimer about results varying by individual"
+}
+
+Be comprehensive and identify all marketing elements that would be useful for creating compelling ads.
+"""
+
+SALES_PAGE_CHUNK_PROMPT = SALES_PAGE_SYSTEM_PROMPT + """
+You are given one part of a longer sales page; other parts are analyzed separately and the results merged. Only fill the fields this part of the page supports and leave the rest empty, including product_name if this part doesn't name the product. Do not guess from outside knowledge.
+
+Also return "confidence": an object mapping each field you filled to a number from 0 to 1, where 1 means the page states it explicitly and lower values mean you inferred it.
+"""
+
+SALES_PAGE_NARRATIVE_PROMPT = """You are an expert marketing assistant. Analyze the following sales page and extract the messaging an advertiser needs to create effective Facebook ad creatives.
+
+The product name, price, availability, ratings and images were already read from the page's structured data; don't repeat them. Extract only:
+- tagline: Main tagline or slogan
+- key_benefits: Array of key benefits of the product
+- features: Array of product features
+- problem_addressed: Problem the product addresses
+- target_audience: Target audience description
+- offer: Object with any discount, limited_time_offer, shipping and guarantee terms (not the price)
+- call_to_action: Call to action text
+- visual_elements_to_include: Array of visual elements to include in ads
+- brand_voice: Brand voice description
+- compliance_notes: Any compliance or legal considerations
+- social_proof: Only when the request asks for it, an object with testimonials (array of quotes), media_mentions (array) and sales_numbers
+
+Use only what the page says; leave fields empty when it doesn't say.
+"""
+
+def ad_concept_context_prompt(ctx: RunContext[Dict[str, Any]]) -> str:
+    """System prompt for the ad concept fallback, built from the product context passed as deps"""
+    return f"""You are an Ad Creative Analysis Agent analyzing an advertisement that will be applied to this product type:
+{json.dumps(ctx.deps, indent=2)}
+
+Return a complete JSON structure with the following fields:
+{{
+  "title": "Brief title describing the ad",
+  "summary": "Overview of the ad's approach",
+  "details": {{
+    "elements": [array of elements with {{type, position, purpose, styling, proportion}}],
+    "visual_flow": "How the eye is guided",
+    "visual_tone": "Emotional/psychological impact",
+    "color_strategy": "Strategic use of color",
+    "typography_approach": "Font choices and text presentation",
+    "spacing_technique": "Use of whitespace",
+    "engagement_mechanics": "How the ad maintains attention",
+    "conversion_elements": "Call-to-action elements",
+    "best_practices": [array of design principles],
+    "primary_offering_visibility": {{"is_visible": boolean, "description": "How the offering stands out"}}
+  }}
+}}
+
+Focus on transferable techniques rather than the specific product category."""
+
+def check_sales_page(output: SalesPageOutput) -> Optional[str]:
+    """Reject sales page extractions that are missing most of what an ad needs"""
+    if not output.product_name.strip() or output.product_name.strip() == "Example Product":
+        return "missing product_name"
+    if not output.key_benefits:
+        return "no key_benefits"
+    core = [output.tagline, output.features, output.problem_addressed, output.target_audience, output.offer, output.call_to_action, output.brand_voice]
+    if sum(1 for value in core if value) < 4:
+        return "too few fields filled"
+    return None
+
+def check_sales_page_narrative(output: SalesPageNarrativeOutput) -> Optional[str]:
+    """Reject narrative extractions missing most of the copy an ad is written from"""
+    if not output.key_benefits:
+        return "no key_benefits"
+    core = [output.tagline, output.features, output.problem_addressed, output.target_audience, output.call_to_action, output.brand_voice]
+    if sum(1 for value in core if value) < 3:
+        return "too few fields filled"
+    return None
+
+def check_ad_concept(output: AdConceptOutput) -> Optional[str]:
+    """Reject ad concepts without the element breakdown recipes are built from"""
+    if not output.title.strip() or not output.summary.strip():
+        return "missing title or summary"
+    elements = output.details.get("elements")
+    if not isinstance(elements, list) or not elements:
+        return "no details.elements"
+    return None
+
+def estimate_tokens(spec: "AgentSpec", prompt: Any, deps: Any) -> int:
+    """Rough token count of a call, for rate limiting before the real usage is known"""
+    parts = prompt if isinstance(prompt, (list, tuple)) else [prompt]
+    text = spec.system_prompt + "".join(part for part in parts if isinstance(part, str))
+    if deps is not None:
+        text += json.dumps(deps, default=str)
+    images = sum(1 for part in parts if not isinstance(part, str))
+    # About 4 characters per token, plus a flat allowance per image and for the output
+    return len(text) // 4 + images * settings.RATE_LIMIT_IMAGE_TOKENS + settings.RATE_LIMIT_OUTPUT_TOKENS
+
+class CascadeExhausted(Exception):
+    """No model in an agent's cascade produced an acceptable output"""
+
+class AgentSpec:
+    """Everything needed to build an agent, kept so it can be built once per process"""
+
+    def __init__(self, name: str, result_type: Any, system_prompt: str = "", dynamic_system_prompts: Optional[List[Callable]] = None, version: str = "1", check: Optional[Callable[[Any], Optional[str]]] = None, **agent_kwargs):
+        self.name = name
+        # Completeness heuristic run on validated outputs: returns why an output
+        # is not good enough, or None to accept it
+        self.check = check
+        # Bump when a dynamic prompt changes; static prompt changes are picked up by their hash
+        self.version = version
+        self.result_type = result_type
+        self.system_prompt = system_prompt
+        self.dynamic_system_prompts = dynamic_system_prompts or []
+        self.agent_kwargs = agent_kwargs
+
+    @property
+    def prompt_version(self) -> str:
+        """Identifies the prompts of this agent in cache keys"""
+        return f"{self.version}:{hashlib.sha256(self.system_prompt.encode('utf-8')).hexdigest()[:16]}"
+
+class AgentRegistry:
+    """
+    Builds each agent once per worker process and hands it out by name
+
+    All agents share one tuned async HTTP client, so connections to the model
+    provider are kept alive across tasks instead of being re-established.
+    Context-specific prompts are passed at run time through deps.
+    """
+
+    def __init__(self):
+        self._specs: Dict[str, AgentSpec] = {}
+        self._agents: Dict[str, Agent] = {}
+        self._models: Dict[str, Model] = {}
+        self.http_client: Optional[httpx.AsyncClient] = None
+
+    def register(self, spec: AgentSpec):
+        self._specs[spec.name] = spec
+
+    def _create_http_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.MODEL_HTTP_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=settings.MODEL_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.MODEL_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.MODEL_HTTP_KEEPALIVE_EXPIRY
+            )
+        )
+
+    def build_model(self, model_name: str) -> Model:
+        """
+        Get the model for a name, building it once on the shared HTTP client
+
+        "openai:" prefixes are accepted, and "test" gives pydantic-ai's offline
+        TestModel, which fills the output schema without calling any API. With
+        MODEL_PROVIDER=offline every name maps to a fixture-backed stand-in.
+        """
+        if model_name not in self._models:
+            if model_name == "test":
+                self._models[model_name] = TestModel()
+            elif settings.MODEL_PROVIDER == "offline":
+                self._models[model_name] = build_offline_model(model_name)
+            else:
+                if self.http_client is None:
+                    self.http_client = self._create_http_client()
+                # The rate limiter owns retries on 429s, so the SDK doesn't retry on its own
+                client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, http_client=self.http_client, max_retries=0)
+                self._models[model_name] = OpenAIModel(
+                    model_name.split(":", 1)[-1],
+                    provider=OpenAIProvider(openai_client=client)
+                )
+        return self._models[model_name]
+
+    def cascade_for(self, name: str) -> List[str]:
+        """Models tried in order for an agent, cheapest first"""
+        return settings.AGENT_CASCADES.get(name) or [settings.AGENT_MODEL]
+
+    def _build(self, spec: AgentSpec) -> Agent:
+        # Runs pick their model from the cascade; this is only the default
+        agent = Agent(
+            self.build_model(self.cascade_for(spec.name)[-1]),
+            result_type=spec.result_type,
+            system_prompt=spec.system_prompt,
+            **spec.agent_kwargs
+        )
+        for prompt in spec.dynamic_system_prompts:
+            agent.system_prompt(prompt)
+        return agent
+
+    def build_all(self):
+        """Build every registered agent that isn't built yet"""
+        for name, spec in self._specs.items():
+            if name not in self._agents:
+                self._agents[name] = self._build(spec)
+        logger.info(f"Built agents: {', '.join(sorted(self._agents))}")
+
+    def get(self, name: str) -> Agent:
+        """Get a built agent, building it on first use outside a worker process"""
+        if name not in self._agents:
+            if name not in self._specs:
+                raise KeyError(f"Unknown agent '{name}'")
+            self._agents[name] = self._build(self._specs[name])
+        return self._agents[name]
+
+    def is_local(self, model_name: str) -> bool:
+        """Whether a model answers without calling a provider (test and offline models)"""
+        return model_name == "test" or settings.MODEL_PROVIDER == "offline"
+
+    def _call_limited(self, agent: Agent, model_name: str, prompt: Any, deps: Any, estimated_tokens: int, timeout: Optional[float]) -> Any:
+        """Run the agent once capacity is available, backing off and retrying on provider 429s"""
+        if self.is_local(model_name):
+            # No provider quota to protect, and benchmarks should measure the pipeline, not the limiter
+            return worker_runtime.run(agent.run(prompt, deps=deps, model=self.build_model(model_name)), timeout)
+        for attempt in range(settings.RATE_LIMIT_MAX_RETRIES + 1):
+            rate_limiter.acquire(model_name, estimated_tokens)
+            try:
+                result = worker_runtime.run(agent.run(prompt, deps=deps, model=self.build_model(model_name)), timeout)
+            except Exception as e:
+                retry_after = retry_after_from(e)
+                if retry_after is None or attempt == settings.RATE_LIMIT_MAX_RETRIES:
+                    raise
+                delay = rate_limiter.backoff(model_name, attempt, retry_after or None)
+                logger.warning(f"{model_name} rate limited, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            usage = result.usage()
+            rate_limiter.settle(model_name, estimated_tokens, usage.total_tokens or 0)
+            return result
+
+    def _attempt(self, spec: AgentSpec, agent: Agent, model_name: str, prompt: Any, deps: Any, timeout: Optional[float]) -> Tuple[Optional[BaseModel], str]:
+        """Run one model of the cascade; returns its output and why it was rejected, if it was"""
+        started = time.perf_counter()
+        try:
+            result = self._call_limited(agent, model_name, prompt, deps, estimate_tokens(spec, prompt, deps), timeout)
+        except (UnexpectedModelBehavior, ValidationError) as e:
+            usage_tracker.record(spec.name, model_name, {"failures": 1, "wall_time": time.perf_counter() - started})
+            return None, f"invalid output: {str(e)[:200]}"
+        except Exception:
+            usage_tracker.record(spec.name, model_name, {"failures": 1, "wall_time": time.perf_counter() - started})
+            raise
+        usage_tracker.record(spec.name, model_name, summarize_run(result, time.perf_counter() - started))
+        reason = spec.check(result.data) if spec.check else None
+        return result.data, reason
+
+    def run(self, name: str, prompt: Any, deps: Any = None, bypass_cache: bool = False, timeout: Optional[float] = None) -> BaseModel:
+        """
+        Run an agent from a worker thread and return its validated output
+
+        The agent's cascade is tried cheapest model first. An output that fails
+        schema validation or the spec's completeness check escalates to the
+        next model; the last model's output is accepted if it at least
+        validates. The path taken is recorded on the running task.
+
+        Outputs are cached by cascade, prompt version, prompt and deps, so the
+        same input is only sent to the models once per cache TTL. Tokens,
+        retries and wall time of every call are recorded against the task.
+        """
+        spec = self._specs[name]
+        agent = self.get(name)
+        cascade = self.cascade_for(name)
+        path: List[Dict[str, Any]] = []
+
+        def call() -> Dict:
+            fallback = None
+            for index, model_name in enumerate(cascade):
+                output, reason = self._attempt(spec, agent, model_name, prompt, deps, timeout)
+                if output is not None and reason is None:
+                    path.append({"model": model_name, "outcome": "accepted"})
+                    return output.model_dump()
+                path.append({"model": model_name, "outcome": "escalated" if index < len(cascade) - 1 else "rejected", "reason": reason})
+                logger.info(f"Agent {name} rejected output of {model_name}: {reason}")
+                if output is not None:
+                    fallback = output
+            if fallback is not None:
+                # Schema-valid but incomplete beats failing the task
+                path[-1]["outcome"] = "accepted_incomplete"
+                return fallback.model_dump()
+            raise CascadeExhausted(f"No model produced a valid {spec.result_type.__name__}: {path[-1]['reason']}")
+
+        key = cache_key(name, ">".join(cascade), spec.prompt_version, prompt, deps)
+        data = llm_cache.get_or_compute(key, call, bypass=bypass_cache)
+        if not path:
+            # Served from the cache or by another worker's identical call
+            usage_tracker.record(name, cascade[-1], {"cache_hits": 1})
+            path.append({"model": "cache", "outcome": "accepted"})
+        usage_tracker.record_cascade(name, path)
+        return spec.result_type.model_validate(data)
+
+    def run_many(self, name: str, prompts: List[Any], deps: Any = None, bypass_cache: bool = False, timeout: Optional[float] = None) -> List[Optional[BaseModel]]:
+        """
+        Run an agent on several prompts concurrently and return outputs in order
+
+        Each prompt goes through run() on its own thread, so the calls share the
+        worker event loop, cache, rate limits and the caller's usage scope, and
+        the whole batch takes about as long as its slowest call. A prompt whose
+        call fails is logged and returned as None.
+        """
+        if not prompts:
+            return []
+
+        def call(prompt: Any) -> Optional[BaseModel]:
+            try:
+                return self.run(name, prompt, deps=deps, bypass_cache=bypass_cache, timeout=timeout)
+            except Exception as e:
+                logger.warning(f"Agent {name} failed on one of {len(prompts)} prompts: {str(e)}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=len(prompts), thread_name_prefix=f"agent-{name}") as pool:
+            # Each call gets a copy of the caller's context, which carries its usage scope
+            futures = [pool.submit(contextvars.copy_context().run, call, prompt) for prompt in prompts]
+            return [future.result() for future in futures]
+
+    async def aclose(self):
+        """Close the shared HTTP client on the loop it was used from"""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+        self.reset()
+
+    def reset(self):
+        """Forget built agents and the HTTP client, e.g. after a fork"""
+        self._agents = {}
+        self._models = {}
+        self.http_client = None
+
+# Create a singleton instance
+agent_registry = AgentRegistry()
+
+agent_registry.register(AgentSpec(
+    "sales_page",
+    result_type=SalesPageOutput,
+    system_prompt=SALES_PAGE_SYSTEM_PROMPT,
+    check=check_sales_page
+))
+
+agent_registry.register(AgentSpec(
+    "sales_page_narrative",
+    result_type=SalesPageNarrativeOutput,
+    system_prompt=SALES_PAGE_NARRATIVE_PROMPT,
+    check=check_sales_page_narrative
+))
+
+agent_registry.register(AgentSpec(
+    "sales_page_chunk",
+    result_type=SalesPageChunkOutput,
+    system_prompt=SALES_PAGE_CHUNK_PROMPT
+))
+
+agent_registry.register(AgentSpec(
+    "ad_concept_fallback",
+    result_type=AdConceptOutput,
+    deps_type=dict,
+    retries=3,
+    dynamic_system_prompts=[ad_concept_context_prompt],
+    check=check_ad_concept
+))
+
+@worker_init.connect
+@worker_process_init.connect
+def build_agents_for_worker(**kwargs):
+    """Build agents once in every worker process, after any fork"""
+    # Connections inherited from the parent process must not be shared
+    agent_registry.reset()
+    agent_registry.build_all()
+
+# The HTTP client lives on the worker loop, so it is closed there before the loop stops
+worker_runtime.on_shutdown(agent_registry.aclose)
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import Depends, Header
+from pydantic_ai import BinaryContent, ImageUrl
+from redis import Redis
+from redis import asyncio as aioredis
+
+from app.core import compression
+from app.core.config import settings
+from app.core.redis import create_sync_redis, get_redis
+from app.services.single_flight import single_flight
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = "llm:cache:"
+# ZSET of cache keys scored by expiry time, used to evict the oldest entries;
+# members scored in the past belong to keys Redis already expired
+CACHE_INDEX_KEY = "llm:cache:index"
+# Hash of "<namespace>:hits" / "<namespace>:misses" counters
+CACHE_STATS_KEY = "llm:cache:stats"
+
+def _fingerprint(part: Any) -> Any:
+    """Reduce one piece of model input to something stable and JSON-serializable"""
+    if isinstance(part, ImageUrl):
+        return {"image_url": part.url}
+    if isinstance(part, BinaryContent):
+        # Images sent inline are keyed by their content, not their bytes
+        return {"binary": hashlib.sha256(part.data).hexdigest(), "media_type": part.media_type}
+    if isinstance(part, (list, tuple)):
+        return [_fingerprint(item) for item in part]
+    if hasattr(part, "model_dump"):
+        return part.model_dump()
+    return part
+
+def cache_key(namespace: str, model: str, prompt_version: str, prompt: Any, deps: Any = None) -> str:
+    """Content address of a model call: the same inputs always map to the same key"""
+    material = json.dumps(
+        {
+            "namespace": namespace,
+            "model": model,
+            "prompt_version": prompt_version,
+            "prompt": _fingerprint(prompt),
+            "deps": _fingerprint(deps),
+        },
+        sort_keys=True,
+        default=str
+    )
+    return f"{CACHE_KEY_PREFIX}{namespace}:{hashlib.sha256(material.encode('utf-8')).hexdigest()}"
+
+class LLMCache:
+    """
+    Redis cache of validated model outputs shared by every worker
+
+    Entries expire after LLM_CACHE_TTL seconds, and the oldest are evicted
+    once there are more than LLM_CACHE_MAX_ENTRIES, so the cache stays
+    bounded even with a long TTL.
+    """
+
+    def __init__(self, client: Optional[Redis] = None):
+        self.client = client or create_sync_redis()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.LLM_CACHE_ENABLED
+
+    def _count(self, namespace: str, outcome: str):
+        try:
+            self.client.hincrby(CACHE_STATS_KEY, f"{namespace}:{outcome}", 1)
+        except Exception as e:
+            logger.warning(f"Error counting LLM cache {outcome}: {str(e)}")
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Get a cached output, or None on a miss; cache errors count as misses"""
+        try:
+            raw = self.client.get(key)
+        except Exception as e:
+            logger.warning(f"Error reading LLM cache: {str(e)}")
+            return None
+        if raw is None:
+            return None
+        return json.loads(compression.decompress(raw))
+
+    def set(self, key: str, value: Dict, ttl: Optional[int] = None):
+        """Store an output and evict the oldest entries beyond the size bound"""
+        ttl = ttl or settings.LLM_CACHE_TTL
+        try:
+            now = time.time()
+            pipe = self.client.pipeline()
+            pipe.set(key, compression.compress(json.dumps(value).encode("utf-8")), ex=ttl)
+            pipe.zadd(CACHE_INDEX_KEY, {key: now + ttl})
+            # Expired entries would otherwise count towards the bound and get live ones evicted
+            pipe.zremrangebyscore(CACHE_INDEX_KEY, "-inf", now)
+            pipe.zcard(CACHE_INDEX_KEY)
+            size = pipe.execute()[-1]
+
+            overflow = size - settings.LLM_CACHE_MAX_ENTRIES
+            if overflow > 0:
+                evicted = [member for member, _ in self.client.zpopmin(CACHE_INDEX_KEY, overflow)]
+                if evicted:
+                    self.client.delete(*evicted)
+        except Exception as e:
+            logger.warning(f"Error writing LLM cache: {str(e)}")
+
+    def get_or_compute(self, key: str, compute: Callable[[], Dict], bypass: bool = False) -> Dict:
+        """
+        Return the cached value for key, computing and storing it on a miss
+
+        With bypass the cache isn't read, but the fresh value still replaces the entry.
+        Concurrent misses for the same key across workers are coalesced into
+        one computation.
+        """
+        namespace = key[len(CACHE_KEY_PREFIX):].split(":", 1)[0]
+        if self.enabled and not bypass:
+            cached = self.get(key)
+            if cached is not None:
+                self._count(namespace, "hits")
+                return cached
+        self._count(namespace, "bypasses" if bypass else "misses")
+
+        def compute_and_store() -> Dict:
+            value = compute()
+            if self.enabled:
+                self.set(key, value)
+            return value
+
+        if settings.SINGLE_FLIGHT_ENABLED:
+            return single_flight.do(key, compute_and_store, bypass=bypass)
+        return compute_and_store()
+
+
+# Create a singleton instance
+llm_cache = LLMCache()
+
+def cache_bypass_requested(
+    x_cache_bypass: Optional[str] = Header(default=None),
+    cache_control: Optional[str] = Header(default=None)
+) -> bool:
+    """FastAPI dependency: whether the client asked to skip cached model results"""
+    if x_cache_bypass is not None and x_cache_bypass.strip().lower() not in ("", "0", "false", "no"):
+        return True
+    return "no-cache" in (cache_control or "").lower()
+
+async def get_llm_cache_stats(redis_client: aioredis.Redis = Depends(get_redis)) -> Dict[str, Any]:
+    """Hit, miss and bypass counts and hit rate per agent, plus the current entry count"""
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hgetall(CACHE_STATS_KEY)
+    pipe.zcount(CACHE_INDEX_KEY, time.time(), "+inf")
+    counters, entries = await pipe.execute()
+
+    agents: Dict[str, Dict[str, float]] = {}
+    for field, value in counters.items():
+        field = field.decode("utf-8") if isinstance(field, bytes) else field
+        namespace, _, outcome = field.rpartition(":")
+        agents.setdefault(namespace, {"hits": 0, "misses": 0, "bypasses": 0})[outcome] = int(value)
+    for counts in agents.values():
+        lookups = counts["hits"] + counts["misses"]
+        counts["hit_rate"] = counts["hits"] / lookups if lookups else 0.0
+    return {"entries": entries, "agents": agents}
@@ -0,0 +1,162 @@
+import asyncio
+import copy
+import logging
+import random
+from typing import Any, Dict, List
+
+from pydantic_ai.messages import ModelMessage, ModelResponse, TextPart, ToolCallPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from app.core.config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Schema-valid outputs returned by the offline backend, keyed by a field only that output has
+SALES_PAGE_FIXTURE = {
+    "product_name": "Offline Test Product",
+    "tagline": "Benchmark-grade results without the network",
+    "key_benefits": ["Saves time", "Reduces costs", "Easy to use"],
+    "features": ["Feature one", "Feature two", "Feature three"],
+    "problem_addressed": "Load testing without calling a paid model API",
+    "target_audience": "Engineers benchmarking the service",
+    "social_proof": {
+        "testimonials": ["It just works"],
+        "media_mentions": [],
+        "sales_numbers": "Over 10,000 simulated customers"
+    },
+    "offer": {
+        "discount": "20% off",
+        "limited_time_offer": "",
+        "shipping": "Free shipping",
+        "guarantee": "30-day money-back guarantee"
+    },
+    "call_to_action": "Get yours today",
+    "visual_elements_to_include": ["Product image", "Customer testimonial"],
+    "brand_voice": "Clear and confident",
+    "compliance_notes": "",
+    "additional_info": {}
+}
+
+SALES_PAGE_NARRATIVE_FIXTURE = {
+    "tagline": "Benchmark-grade results without the network",
+    "key_benefits": ["Saves time", "Reduces costs", "Easy to use"],
+    "features": ["Feature one", "Feature two", "Feature three"],
+    "problem_addressed": "Load testing without calling a paid model API",
+    "target_audience": "Engineers benchmarking the service",
+    "offer": {"discount": "20% off", "shipping": "Free shipping", "guarantee": "30-day money-back guarantee"},
+    "call_to_action": "Get yours today",
+    "visual_elements_to_include": ["Product image", "Customer testimonial"],
+    "brand_voice": "Clear and confident",
+    "compliance_notes": ""
+}
+
+AD_CONCEPT_FIXTURE = {
+    "title": "Offline Test Concept",
+    "summary": "Product-centred layout with a bold headline and a single call to action",
+    "details": {
+        "elements": [
+            {"type": "headline", "position": "top", "purpose": "hook", "styling": "bold sans-serif", "proportion": "15%"},
+            {"type": "product_image", "position": "center", "purpose": "show the offering", "styling": "clean background", "proportion": "50%"},
+            {"type": "cta_button", "position": "bottom", "purpose": "conversion", "styling": "high contrast", "proportion": "10%"}
+        ],
+        "visual_flow": "Top to bottom, headline to product to call to action",
+        "visual_tone": "Confident and uncluttered",
+        "color_strategy": "Neutral background with one accent color",
+        "typography_approach": "Heavy headline, light body text",
+        "spacing_technique": "Generous whitespace around the product",
+        "engagement_mechanics": "Curiosity-led headline",
+        "conversion_elements": "Single prominent button",
+        "best_practices": ["One message per ad", "Product in the visual center"],
+        "primary_offering_visibility": {"is_visible": True, "description": "Product fills the center of the frame"}
+    }
+}
+
+# Matched in order against the result schema's fields; sales page schemas share "tagline"
+FIXTURES = {
+    "product_name": SALES_PAGE_FIXTURE,
+    "tagline": SALES_PAGE_NARRATIVE_FIXTURE,
+    "title": AD_CONCEPT_FIXTURE,
+}
+
+class OfflineModelError(Exception):
+    """Error injected by the offline backend to simulate provider failures"""
+
+def sample_latency(model_name: str) -> float:
+    """Draw a response latency in seconds from the distribution configured for a model"""
+    latencies = settings.OFFLINE_MODEL_LATENCY
+    config = latencies.get(model_name, latencies.get("default", {}))
+    distribution = config.get("distribution", "lognormal")
+    if distribution == "fixed":
+        return config.get("seconds", 0.0)
+    if distribution == "uniform":
+        return random.uniform(config.get("min", 0.0), config.get("max", 1.0))
+    # Lognormal matches the long right tail of real model latencies
+    return random.lognormvariate(0, config.get("sigma", 0.5)) * config.get("median", 1.0)
+
+def _fixture_for(info: AgentInfo) -> Dict[str, Any]:
+    properties = info.result_tools[0].parameters_json_schema.get("properties", {}) if info.result_tools else {}
+    for field, fixture in FIXTURES.items():
+        if field in properties:
+            return copy.deepcopy(fixture)
+    return {}
+
+def build_offline_model(model_name: str) -> FunctionModel:
+    """
+    A FunctionModel standing in for model_name without any network access
+
+    It answers with schema-valid fixtures after a sampled latency. It fails
+    with OFFLINE_MODEL_ERROR_RATE and returns an output missing required
+    fields with OFFLINE_MODEL_INVALID_RATE, which exercises retries and the
+    model cascade.
+    """
+
+    async def respond(messages: List[ModelMessage], info: AgentInfo) -> ModelResponse:
+        await asyncio.sleep(sample_latency(model_name))
+        if random.random() < settings.OFFLINE_MODEL_ERROR_RATE:
+            raise OfflineModelError(f"Injected error from offline {model_name}")
+
+        if not info.result_tools:
+            return ModelResponse(parts=[TextPart(content="Offline response")], model_name=model_name)
+
+        output = _fixture_for(info)
+        if random.random() < settings.OFFLINE_MODEL_INVALID_RATE:
+            output = {}
+        return ModelResponse(
+            parts=[ToolCallPart(tool_name=info.result_tools[0].name, args=output)],
+            model_name=model_name
+        )
+
+    return FunctionModel(respond)
+
+# Page served instead of fetching a sales page when MODEL_PROVIDER is offline
+OFFLINE_SALES_PAGE_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<title>Offline Test Product</title>
+<meta name="description" content="Benchmark-grade results without the network">
+<meta property="og:title" content="Offline Test Product">
+<script type="application/ld+json">
+{"@context": "https://schema.org", "@type": "Product", "name": "Offline Test Product",
+ "description": "Benchmark-grade results without the network",
+ "offers": {"@type": "Offer", "price": "29.99", "priceCurrency": "USD"},
+ "aggregateRating": {"@type": "AggregateRating", "ratingValue": "4.8", "reviewCount": "1200"}}
+</script>
+</head>
+<body>
+<nav><a href="/">Home</a><a href="/shop">Shop</a></nav>
+<main>
+<h1>Offline Test Product</h1>
+<p>Benchmark-grade results without the network.</p>
+<h2>Benefits</h2>
+<ul><li>Saves time</li><li>Reduces costs</li><li>Easy to use</li></ul>
+<h2>What customers say</h2>
+<blockquote>It just works.</blockquote>
+<h2>Offer</h2>
+<p>20% off today. Free shipping. 30-day money-back guarantee.</p>
+<button>Get yours today</button>
+</main>
+<footer>Offline Test Co.</footer>
+</body>
+</html>
+"""
@@ -0,0 +1,190 @@
+import re
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.services.page_parser import ParsedPage, TextBlock
+
+# Words that show a section carries one of the SalesPageOutput fields, with their weight
+FIELD_SIGNALS: Dict[str, Dict[str, float]] = {
+    "benefits": {
+        "benefit": 3, "why": 1, "feature": 2, "results": 2, "helps": 1, "improve": 1, "boost": 1,
+        "how it works": 2, "ingredients": 2, "made with": 1, "designed": 1, "problem": 2, "tired of": 2,
+    },
+    "offer": {
+        "price": 3, "$": 2, "€": 2, "£": 2, "% off": 3, "discount": 3, "save": 2, "sale": 2, "bundle": 2,
+        "free shipping": 3, "shipping": 1, "guarantee": 3, "money-back": 3, "limited": 2, "today only": 2,
+        "offer": 3, "subscribe": 1, "bonus": 2,
+    },
+    "social_proof": {
+        "review": 3, "testimonial": 3, "rated": 2, "stars": 2, "★": 2, "customers": 2, "verified": 2,
+        "as seen": 3, "featured in": 3, "sold": 2, "trusted": 2, "loved by": 2,
+    },
+    "call_to_action": {
+        "buy now": 3, "order now": 3, "shop now": 3, "add to cart": 3, "get yours": 3, "get started": 2,
+        "claim": 2, "try it": 2, "order today": 3,
+    },
+}
+# Sections that rarely hold anything the extraction needs
+LOW_VALUE_SIGNALS = {
+    "terms": 3, "privacy": 3, "cookie": 3, "disclaimer": 3, "copyright": 3, "©": 2, "all rights reserved": 3,
+    "refund policy": 2, "these statements have not been evaluated": 4, "return policy": 2, "faq": 1,
+    "frequently asked": 1,
+}
+NON_WORD = re.compile(r"[^\w$€£%★©]+")
+
+def count_tokens(text: str) -> int:
+    """Rough token count, about 4 characters per token"""
+    return (len(text) + 3) // 4
+
+class Section:
+    """A heading and the blocks below it, up to the next heading"""
+
+    def __init__(self, index: int, heading: Optional[TextBlock] = None):
+        self.index = index
+        self.heading = heading
+        self.blocks: List[TextBlock] = []
+        self.score = 0.0
+
+    def lines(self) -> List[str]:
+        lines = []
+        if self.heading:
+            lines.append(f"{'#' * self.heading.heading_level} {self.heading.text}")
+        for block in self.blocks:
+            lines.append(f"- {block.text}" if block.tag == "li" else block.text)
+        return lines
+
+    def text(self) -> str:
+        return "\n".join(self.lines())
+
+class CondensedPage:
+    """Page text packed into a token budget, with the counts before and after"""
+
+    def __init__(self, text: str, tokens_before: int, tokens_after: int, sections_total: int, sections_kept: int):
+        self.text = text
+        self.tokens_before = tokens_before
+        self.tokens_after = tokens_after
+        self.sections_total = sections_total
+        self.sections_kept = sections_kept
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "page_tokens_before": self.tokens_before,
+            "page_tokens_after": self.tokens_after,
+            "page_sections_total": self.sections_total,
+            "page_sections_kept": self.sections_kept,
+        }
+
+def split_sections(page: ParsedPage) -> List[Section]:
+    """Group a page's blocks under the heading they appear after"""
+    sections = [Section(0)]
+    for block in page.blocks:
+        if block.heading_level:
+            sections.append(Section(len(sections), heading=block))
+        else:
+            sections[-1].blocks.append(block)
+    return [section for section in sections if section.blocks or section.heading]
+
+def score_section(section: Section, position: float) -> float:
+    """
+    How likely a section is to hold extracted fields
+
+    Each field's signals count once per section, so a wall of fifty
+    testimonials scores like one; headings count double. Earlier sections
+    score slightly higher, as the hero and offer tend to come first.
+    """
+    body = section.text().lower()
+    heading = section.heading.text.lower() if section.heading else ""
+    score = 0.0
+    for signals in FIELD_SIGNALS.values():
+        score += max((weight * (2 if signal in heading else 1) for signal, weight in signals.items() if signal in body), default=0)
+    score -= max((weight * (2 if signal in heading else 1) for signal, weight in LOW_VALUE_SIGNALS.items() if signal in body), default=0)
+    return score + 2 * (1 - position)
+
+def _fingerprint(text: str) -> str:
+    return NON_WORD.sub(" ", text.lower()).strip()
+
+def condense_page(page: ParsedPage, budget: Optional[int] = None) -> CondensedPage:
+    """
+    Pack the most useful sections of a page into a token budget
+
+    Sections are ranked by score_section and added best first; near-identical
+    blocks (the same text with different punctuation or casing) are kept once.
+    A section that doesn't fit whole contributes its leading blocks. The
+    title, description and first section (the hero) come first, sections
+    scored at zero or below are dropped, and the result is in page order.
+    """
+    budget = budget or settings.SALES_PAGE_TOKEN_BUDGET
+    full_text = page.text()
+    sections = split_sections(page)
+
+    header = []
+    if page.title:
+        header.append(f"Title: {page.title}")
+    if page.description:
+        header.append(f"Description: {page.description}")
+    remaining = budget - count_tokens("\n".join(header))
+
+    seen = set()
+    for section in sections:
+        unique = []
+        for block in section.blocks:
+            fingerprint = _fingerprint(block.text)
+            if fingerprint and fingerprint not in seen:
+                seen.add(fingerprint)
+                unique.append(block)
+        section.blocks = unique
+        section.score = score_section(section, section.index / max(len(sections), 1))
+
+    # The opening section (the hero) goes first, then the rest best first
+    hero = sections[0].index if sections else 0
+    ranked = sorted(
+        (section for section in sections if section.index == hero or section.score > 0),
+        key=lambda section: (section.index != hero, -section.score, section.index)
+    )
+    pending = {section.index: section.lines() for section in ranked}
+    kept: Dict[int, List[str]] = {}
+    # The first pass caps each section at a share of the budget, so one long
+    # testimonial wall can't crowd out the offer; the second fills what is left
+    for cap in (max(budget // 4, 1), budget):
+        for section in ranked:
+            lines = kept.setdefault(section.index, [])
+            used = sum(count_tokens(line) + 1 for line in lines)
+            while pending[section.index] and remaining > 0:
+                cost = count_tokens(pending[section.index][0]) + 1
+                if cost > remaining or used + cost > cap:
+                    break
+                lines.append(pending[section.index].pop(0))
+                used += cost
+                remaining -= cost
+    # A heading cut off from all of its blocks says nothing
+    for section in ranked:
+        lines = kept[section.index]
+        if not lines or (section.heading and section.blocks and len(lines) == 1):
+            del kept[section.index]
+
+    text = "\n".join(header + [line for index in sorted(kept) for line in kept[index]])
+    return CondensedPage(
+        text=text,
+        tokens_before=count_tokens(full_text),
+        tokens_after=count_tokens(text),
+        sections_total=len(sections),
+        sections_kept=len(kept)
+    )
+
+def chunk_text(text: str, max_tokens: int) -> List[str]:
+    """
+    Split condensed page text into chunks of about max_tokens
+
+    Chunks end at line boundaries, and once a chunk is half full a heading
+    starts the next one, so sections stay together where they can.
+    """
+    chunks: List[List[str]] = [[]]
+    used = 0
+    for line in text.split("\n"):
+        cost = count_tokens(line) + 1
+        if chunks[-1] and (used + cost > max_tokens or (line.startswith("#") and used > max_tokens // 2)):
+            chunks.append([])
+            used = 0
+        chunks[-1].append(line)
+        used += cost
+    return ["\n".join(lines) for lines in chunks if lines]
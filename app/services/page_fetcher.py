@@ -0,0 +1,197 @@
+import asyncio
+import ipaddress
+import logging
+import socket
+from typing import Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.runtime import worker_runtime
+from app.services.offline_models import OFFLINE_SALES_PAGE_HTML
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+ALLOWED_SCHEMES = ("http", "https")
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+class PageFetchError(Exception):
+    """A sales page could not be downloaded as HTML"""
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%")[0])
+    # An IPv4-mapped IPv6 address (::ffff:127.0.0.1) is checked as the IPv4 address
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not (
+        ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved or ip.is_multicast or ip.is_unspecified
+    )
+
+async def check_public_url(url: httpx.URL):
+    """
+    Raise PageFetchError unless a URL is http(s) on a host that only resolves to public addresses
+
+    Page URLs come from API callers, so without this a worker could be made
+    to fetch Redis, internal services or the cloud metadata endpoint.
+    """
+    if url.scheme not in ALLOWED_SCHEMES:
+        raise PageFetchError(f"{url} is not an http(s) URL")
+    if not url.host:
+        raise PageFetchError(f"{url} has no host")
+    port = url.port or (443 if url.scheme == "https" else 80)
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(url.host, port, type=socket.SOCK_STREAM)
+    except OSError as e:
+        raise PageFetchError(f"Could not resolve {url.host}: {str(e)}") from e
+    for *_, sockaddr in addresses:
+        if not _is_public(sockaddr[0]):
+            raise PageFetchError(f"{url.host} resolves to a non-public address")
+
+def check_public_peer(response: httpx.Response):
+    """
+    Raise PageFetchError unless a response came from a public address
+
+    httpx resolves the host again when it connects, so a short-lived DNS
+    record could pass check_public_url and then point at an internal
+    address. The address actually connected to is checked before any of the
+    body is read; a response whose peer is unknown is refused.
+    """
+    stream = response.extensions.get("network_stream")
+    peer = stream.get_extra_info("server_addr") if stream is not None else None
+    if not peer:
+        raise PageFetchError(f"Could not tell which address {response.url.host} was fetched from")
+    if not _is_public(peer[0]):
+        raise PageFetchError(f"{response.url.host} connected to a non-public address")
+
+class FetchedPage:
+    """A downloaded page and the response headers worth keeping"""
+
+    def __init__(self, url: str, status_code: int, html: str, headers: Optional[Dict[str, str]] = None):
+        self.url = url
+        self.status_code = status_code
+        self.html = html
+        # Lower-cased header names
+        self.headers = headers or {}
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status_code == 304
+
+    def validators(self) -> Dict[str, str]:
+        """The ETag and Last-Modified the server sent, for revalidating the page later"""
+        validators = {}
+        if self.headers.get("etag"):
+            validators["etag"] = self.headers["etag"]
+        if self.headers.get("last-modified"):
+            validators["last_modified"] = self.headers["last-modified"]
+        return validators
+
+def conditional_headers(validators: Dict[str, str]) -> Dict[str, str]:
+    """If-None-Match / If-Modified-Since headers from stored validators"""
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+class PageFetcher:
+    """
+    Downloads sales pages on the worker event loop through one pooled client
+
+    The client lives as long as the worker's loop, so connections to sites
+    that are fetched repeatedly are kept alive. Only http(s) URLs on public
+    addresses are fetched: the host is checked before connecting and the
+    connected address before reading, on every redirect, and bodies are
+    capped at PAGE_FETCH_MAX_BYTES. With MODEL_PROVIDER=offline a fixture page is
+    returned instead, so benchmarks never touch the network.
+    """
+
+    def __init__(self):
+        self.client: Optional[httpx.AsyncClient] = None
+
+    def _create_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.PAGE_FETCH_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(max_connections=settings.PAGE_FETCH_MAX_CONNECTIONS, max_keepalive_connections=20),
+            # Redirects are followed by fetch(), which checks every hop's host
+            follow_redirects=False,
+            # The connected peer is checked, which through a proxy would be the proxy
+            trust_env=False,
+            headers={
+                "User-Agent": settings.PAGE_FETCH_USER_AGENT,
+                "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.5",
+                "Accept-Language": "en-US,en;q=0.9",
+            }
+        )
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> FetchedPage:
+        """
+        Download a page; raises PageFetchError for errors and non-HTML responses
+
+        Pass conditional_headers() to revalidate a page fetched before: an
+        unchanged page then comes back as a bodiless 304.
+        """
+        if settings.MODEL_PROVIDER == "offline":
+            return FetchedPage(url, 200, OFFLINE_SALES_PAGE_HTML)
+        if self.client is None:
+            self.client = self._create_client()
+
+        try:
+            target = httpx.URL(url)
+        except httpx.InvalidURL as e:
+            raise PageFetchError(f"Invalid URL {url}: {str(e)}") from e
+
+        try:
+            for _ in range(MAX_REDIRECTS + 1):
+                await check_public_url(target)
+                response = await self.client.send(self.client.build_request("GET", target, headers=headers), stream=True)
+                try:
+                    check_public_peer(response)
+                    if response.status_code in REDIRECT_STATUSES and response.headers.get("location"):
+                        target = response.url.join(response.headers["location"])
+                        continue
+                    return await self._read(url, response)
+                finally:
+                    await response.aclose()
+            raise PageFetchError(f"{url} redirected more than {MAX_REDIRECTS} times")
+        except httpx.HTTPError as e:
+            raise PageFetchError(f"Error fetching {url}: {str(e)}") from e
+
+    async def _read(self, url: str, response: httpx.Response) -> FetchedPage:
+        """Read a final (non-redirect) response as an HTML page"""
+        response_headers = {name.lower(): value for name, value in response.headers.items()}
+        if response.status_code == 304:
+            return FetchedPage(str(response.url), 304, "", response_headers)
+        if response.status_code >= 400:
+            raise PageFetchError(f"{url} returned HTTP {response.status_code}")
+        content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type not in HTML_CONTENT_TYPES:
+            raise PageFetchError(f"{url} is {content_type or 'of unknown type'}, not HTML")
+
+        body = bytearray()
+        async for chunk in response.aiter_bytes():
+            body.extend(chunk)
+            if len(body) >= settings.PAGE_FETCH_MAX_BYTES:
+                logger.warning(f"Truncating {url} at {settings.PAGE_FETCH_MAX_BYTES} bytes")
+                break
+        html = bytes(body[:settings.PAGE_FETCH_MAX_BYTES]).decode(response.encoding or "utf-8", errors="replace")
+        return FetchedPage(str(response.url), response.status_code, html, response_headers)
+
+    def fetch_sync(self, url: str, headers: Optional[Dict[str, str]] = None) -> FetchedPage:
+        """Download a page from a worker thread"""
+        return worker_runtime.run(self.fetch(url, headers=headers), timeout=settings.PAGE_FETCH_TIMEOUT * 2)
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+# Create a singleton instance
+page_fetcher = PageFetcher()
+
+# The client lives on the worker loop, so it is closed there before the loop stops
+worker_runtime.on_shutdown(page_fetcher.aclose)
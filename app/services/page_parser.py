@@ -0,0 +1,227 @@
+import hashlib
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+
+# Elements whose content is never page copy
+SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "select"}
+# Page chrome repeated on every page of a site
+BOILERPLATE_TAGS = {"nav", "footer", "aside"}
+# A <header> is page chrome only outside the content; inside it, it is often the hero
+CONTENT_TAGS = {"main", "article", "section"}
+# Forms that aren't part of the offer; product forms hold the price, variants and CTA
+BOILERPLATE_FORMS = re.compile(r"search|newsletter|subscribe|signup|sign-up|login|contact", re.I)
+BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "complementary", "search"}
+BOILERPLATE_MARKERS = re.compile(r"(^|[-_ ])(nav|navbar|menu|footer|breadcrumbs?|cookie|consent|newsletter|drawer|announcement-bar|skip-link)([-_ ]|$)", re.I)
+# Elements that end a run of text
+BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "li", "ul", "ol", "dl", "dt", "dd", "table", "tr", "td", "th",
+    "blockquote", "figcaption", "h1", "h2", "h3", "h4", "h5", "h6", "br", "hr", "button", "summary", "details",
+}
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+WHITESPACE = re.compile(r"\s+")
+
+class TextBlock:
+    """A run of visible text, with the heading it appears under"""
+
+    def __init__(self, text: str, tag: str, heading: Optional[str] = None, heading_level: Optional[int] = None):
+        self.text = text
+        self.tag = tag
+        # Set on the block that is itself a heading
+        self.heading_level = heading_level
+        # The nearest heading above this block
+        self.heading = heading
+
+class ParsedPage:
+    """Main-content text and metadata of an HTML page"""
+
+    def __init__(self, title: str, description: str, blocks: List[TextBlock], json_ld: List[str], meta: Dict[str, str], microdata: List[Tuple[str, str]]):
+        self.title = title
+        self.description = description
+        self.blocks = blocks
+        # Raw JSON-LD script bodies
+        self.json_ld = json_ld
+        # <meta> tags by name or property, e.g. "og:title"
+        self.meta = meta
+        # (itemprop, value) pairs in document order
+        self.microdata = microdata
+
+    def text(self) -> str:
+        """The page's main content as compact text, headings marked in Markdown style"""
+        lines = []
+        if self.title:
+            lines.append(f"Title: {self.title}")
+        if self.description:
+            lines.append(f"Description: {self.description}")
+        for block in self.blocks:
+            if block.heading_level:
+                lines.append(f"{'#' * block.heading_level} {block.text}")
+            elif block.tag == "li":
+                lines.append(f"- {block.text}")
+            else:
+                lines.append(block.text)
+        return "\n".join(lines)
+
+    def content_hash(self) -> str:
+        """
+        SHA-256 of the page's main content, ignoring case and whitespace
+
+        Markup, scripts, tracking tags and page chrome don't contribute, so
+        it only changes when the copy or structured data does.
+        """
+        content = "\n".join([self.text()] + self.json_ld)
+        return hashlib.sha256(WHITESPACE.sub(" ", content).strip().lower().encode("utf-8")).hexdigest()
+
+class PageParser(HTMLParser):
+    """
+    Reduces an HTML page to its main-content text blocks
+
+    Scripts, styles, navigation, site headers, footers, search and newsletter
+    forms and similar boilerplate are dropped (headers inside the content and
+    product forms are kept), repeated blocks are kept once, and JSON-LD, meta tags and
+    microdata are collected on the way for structured-data extraction.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # Open elements: (tag, skipped, has role="main")
+        self._stack: List[Tuple[str, bool, bool]] = []
+        self._skip_depth = 0
+        self._buffer: List[str] = []
+        self._buffer_tag = "p"
+        self._heading: Optional[str] = None
+        self._in_title = False
+        self._title: List[str] = []
+        self._json_ld: Optional[List[str]] = None
+        self._itemprop: Optional[Tuple[str, List[str]]] = None
+        self._seen = set()
+        self.blocks: List[TextBlock] = []
+        self.json_ld: List[str] = []
+        self.meta: Dict[str, str] = {}
+        self.microdata: List[Tuple[str, str]] = []
+
+    def _in_content(self) -> bool:
+        return any(open_tag in CONTENT_TAGS or is_content for open_tag, _, is_content in self._stack)
+
+    def _is_boilerplate(self, tag: str, attrs: Dict[str, str]) -> bool:
+        if tag in SKIPPED_TAGS or tag in BOILERPLATE_TAGS:
+            return True
+        if tag == "header" and not self._in_content():
+            return True
+        if tag == "form" and BOILERPLATE_FORMS.search(" ".join(attrs.get(name, "") for name in ("role", "action", "id", "class", "name"))):
+            return True
+        if attrs.get("role", "").lower() in BOILERPLATE_ROLES or attrs.get("aria-hidden") == "true" or "hidden" in attrs:
+            return True
+        return bool(BOILERPLATE_MARKERS.search(f"{attrs.get('id', '')} {attrs.get('class', '')}"))
+
+    def _flush(self):
+        text = WHITESPACE.sub(" ", "".join(self._buffer)).strip()
+        self._buffer = []
+        if not text:
+            return
+        level = HEADING_TAGS.get(self._buffer_tag)
+        if level:
+            self._heading = text
+        # Repeated blocks (sticky CTAs, carousels cloned for looping) are kept once
+        key = text.lower()
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        self.blocks.append(TextBlock(text, self._buffer_tag, heading=self._heading, heading_level=level))
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value or "" for name, value in attrs}
+
+        if tag == "meta":
+            name = attrs.get("property") or attrs.get("name") or attrs.get("itemprop")
+            if name and attrs.get("content"):
+                self.meta.setdefault(name.lower(), attrs["content"].strip())
+                if attrs.get("itemprop"):
+                    self.microdata.append((attrs["itemprop"], attrs["content"].strip()))
+            return
+        if tag == "script" and "ld+json" in attrs.get("type", "").lower():
+            self._json_ld = []
+        if tag == "title" and not self._skip_depth:
+            self._in_title = True
+        if attrs.get("itemprop") and not self._skip_depth:
+            # Attribute-carried values (links, images, times) are complete on the tag itself
+            value = attrs.get("content") or attrs.get("href") or attrs.get("src") or attrs.get("datetime")
+            if value:
+                self.microdata.append((attrs["itemprop"], value.strip()))
+            elif tag not in VOID_TAGS:
+                self._itemprop = (attrs["itemprop"], [])
+
+        if tag in VOID_TAGS:
+            if tag in BLOCK_TAGS and not self._skip_depth:
+                self._flush()
+            return
+
+        skipped = self._is_boilerplate(tag, attrs)
+        self._stack.append((tag, skipped, attrs.get("role", "").lower() == "main"))
+        if skipped:
+            self._skip_depth += 1
+        elif not self._skip_depth and tag in BLOCK_TAGS:
+            self._flush()
+            self._buffer_tag = tag
+
+    def handle_endtag(self, tag):
+        if tag == "script" and self._json_ld is not None:
+            self.json_ld.append("".join(self._json_ld))
+            self._json_ld = None
+        if tag == "title":
+            self._in_title = False
+        if self._itemprop and not self._skip_depth:
+            name, parts = self._itemprop
+            value = WHITESPACE.sub(" ", "".join(parts)).strip()
+            if value:
+                self.microdata.append((name, value))
+            self._itemprop = None
+
+        if tag in VOID_TAGS or not any(open_tag == tag for open_tag, _, _ in self._stack):
+            return
+        # Close everything left open inside this element, as browsers do
+        while self._stack:
+            open_tag, skipped, _ = self._stack.pop()
+            if skipped:
+                self._skip_depth -= 1
+            if open_tag == tag:
+                break
+        if not self._skip_depth and tag in BLOCK_TAGS:
+            self._flush()
+            self._buffer_tag = "p"
+
+    def handle_data(self, data):
+        if self._json_ld is not None:
+            self._json_ld.append(data)
+            return
+        if self._in_title:
+            self._title.append(data)
+            return
+        if self._skip_depth:
+            return
+        if self._itemprop:
+            self._itemprop[1].append(data)
+        self._buffer.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+    @property
+    def title(self) -> str:
+        return WHITESPACE.sub(" ", "".join(self._title)).strip()
+
+def parse_page(html: str) -> ParsedPage:
+    """Parse an HTML document into main-content blocks and metadata"""
+    parser = PageParser()
+    parser.feed(html)
+    parser.close()
+    return ParsedPage(
+        title=parser.title or parser.meta.get("og:title", ""),
+        description=parser.meta.get("description") or parser.meta.get("og:description", ""),
+        blocks=parser.blocks,
+        json_ld=parser.json_ld,
+        meta=parser.meta,
+        microdata=parser.microdata
+    )
@@ -0,0 +1,214 @@
+import logging
+import random
+import time
+from typing import Any, Dict, Optional
+
+from fastapi import Depends
+from redis import Redis
+from redis import asyncio as aioredis
+
+from app.core.config import settings
+from app.core.redis import create_sync_redis, get_redis
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Refills both buckets for the time elapsed since the last call, then takes one
+# request and the estimated tokens if both have enough. Returns 0 when
+# admitted, otherwise the milliseconds until enough would have refilled.
+# Redis' clock is used so workers with skewed clocks agree.
+ACQUIRE_SCRIPT = """
+local rpm = tonumber(ARGV[1])
+local tpm = tonumber(ARGV[2])
+local cost = math.min(tonumber(ARGV[3]), tpm)
+local clock = redis.call('TIME')
+local now = clock[1] * 1000 + math.floor(clock[2] / 1000)
+
+local blocked = tonumber(redis.call('HGET', KEYS[1], 'blocked_until') or '0')
+if blocked > now then
+    return blocked - now
+end
+
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'ts')
+local requests = tonumber(state[1]) or rpm
+local tokens = tonumber(state[2]) or tpm
+local elapsed = math.max(now - (tonumber(state[3]) or now), 0)
+requests = math.min(rpm, requests + elapsed * rpm / 60000)
+tokens = math.min(tpm, tokens + elapsed * tpm / 60000)
+
+local wait = 0
+if requests < 1 then
+    wait = math.max(wait, (1 - requests) * 60000 / rpm)
+end
+if tokens < cost then
+    wait = math.max(wait, (cost - tokens) * 60000 / tpm)
+end
+if wait == 0 then
+    requests = requests - 1
+    tokens = tokens - cost
+end
+redis.call('HSET', KEYS[1], 'requests', tostring(requests), 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], 120000)
+return math.ceil(wait)
+"""
+
+# Gives back (or takes) the difference between estimated and actual tokens
+SETTLE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HINCRBYFLOAT', KEYS[1], 'tokens', ARGV[1])
+end
+return 0
+"""
+
+# Holds every worker back until the provider's Retry-After has passed
+BLOCK_SCRIPT = """
+local clock = redis.call('TIME')
+local now = clock[1] * 1000 + math.floor(clock[2] / 1000)
+local until_ms = now + tonumber(ARGV[1])
+local blocked = tonumber(redis.call('HGET', KEYS[1], 'blocked_until') or '0')
+if until_ms > blocked then
+    redis.call('HSET', KEYS[1], 'blocked_until', until_ms)
+    redis.call('PEXPIRE', KEYS[1], math.max(120000, tonumber(ARGV[1]) + 60000))
+end
+return 0
+"""
+
+def rate_limit_key(model: str) -> str:
+    """Redis hash holding a model's request and token buckets"""
+    return f"ratelimit:{model}"
+
+def rate_limit_stats_key(model: str) -> str:
+    """Redis hash counting a model's admissions, waits and provider 429s"""
+    return f"ratelimit:{model}:stats"
+
+class RateLimitTimeout(Exception):
+    """A model call waited longer than RATE_LIMIT_MAX_WAIT_SECONDS for capacity"""
+
+def _limits(model: str) -> Optional[Dict[str, float]]:
+    """Effective RPM/TPM for a model after headroom, or None if it isn't limited"""
+    limits = settings.MODEL_RATE_LIMITS.get(model)
+    if not limits:
+        return None
+    return {
+        "rpm": max(limits["rpm"] * settings.RATE_LIMIT_HEADROOM, 1),
+        "tpm": max(limits["tpm"] * settings.RATE_LIMIT_HEADROOM, 1),
+    }
+
+class RateLimiter:
+    """
+    Distributed token buckets for each model's requests and tokens per minute
+
+    Every worker takes capacity from the same Redis buckets before calling a
+    model, so the cluster as a whole stays just under the provider quota
+    (MODEL_RATE_LIMITS scaled by RATE_LIMIT_HEADROOM) instead of bursting
+    into 429s. A 429 blocks the model for every worker until its Retry-After.
+    """
+
+    def __init__(self, client: Optional[Redis] = None):
+        self.client = client or create_sync_redis()
+        self._acquire = self.client.register_script(ACQUIRE_SCRIPT)
+        self._settle = self.client.register_script(SETTLE_SCRIPT)
+        self._block = self.client.register_script(BLOCK_SCRIPT)
+
+    def acquire(self, model: str, estimated_tokens: int):
+        """Block the calling thread until the model has capacity for one request of this size"""
+        limits = _limits(model)
+        if limits is None:
+            return
+        deadline = time.monotonic() + settings.RATE_LIMIT_MAX_WAIT_SECONDS
+        waited = False
+        while True:
+            wait_ms = self._acquire(keys=[rate_limit_key(model)], args=[limits["rpm"], limits["tpm"], estimated_tokens])
+            if not wait_ms:
+                self.client.hincrby(rate_limit_stats_key(model), "waited" if waited else "admitted", 1)
+                return
+            # Jitter keeps workers that were refused together from retrying together
+            delay = wait_ms / 1000 * (1 + random.uniform(0, settings.RATE_LIMIT_JITTER))
+            if time.monotonic() + delay > deadline:
+                raise RateLimitTimeout(f"No {model} capacity within {settings.RATE_LIMIT_MAX_WAIT_SECONDS}s")
+            waited = True
+            time.sleep(delay)
+
+    def settle(self, model: str, estimated_tokens: int, actual_tokens: int):
+        """Correct the token bucket once the real usage of a call is known"""
+        if _limits(model) is None or not actual_tokens:
+            return
+        try:
+            self._settle(keys=[rate_limit_key(model)], args=[estimated_tokens - actual_tokens])
+        except Exception as e:
+            logger.warning(f"Error settling rate limit tokens for {model}: {str(e)}")
+
+    def backoff(self, model: str, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Record a provider 429 and return how long to wait before retrying
+
+        The provider's Retry-After is honoured and shared with every worker;
+        without one, exponential backoff with full jitter is used.
+        """
+        if retry_after is None:
+            retry_after = random.uniform(0, settings.RATE_LIMIT_BACKOFF_BASE * 2 ** attempt)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hincrby(rate_limit_stats_key(model), "throttled", 1)
+            pipe.execute()
+            self._block(keys=[rate_limit_key(model)], args=[int(retry_after * 1000)])
+        except Exception as e:
+            logger.warning(f"Error recording rate limit backoff for {model}: {str(e)}")
+        return retry_after
+
+# Create a singleton instance
+rate_limiter = RateLimiter()
+
+def retry_after_from(error: BaseException) -> Optional[float]:
+    """
+    Seconds to wait if an error (or its cause) is a provider 429, else None
+
+    Returns 0.0 for a 429 without a usable Retry-After header. Wrappers such
+    as pydantic-ai's ModelHTTPError carry the status but not the response, so
+    the header is looked for along the whole cause chain.
+    """
+    rate_limited = False
+    while error is not None:
+        status = getattr(error, "status_code", None)
+        response = getattr(error, "response", None)
+        if status is None and response is not None:
+            status = getattr(response, "status_code", None)
+        if status == 429:
+            rate_limited = True
+            headers = getattr(response, "headers", None) or {}
+            for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+                try:
+                    return float(headers[header]) * scale
+                except (KeyError, TypeError, ValueError):
+                    continue
+        error = error.__cause__ or error.__context__
+    return 0.0 if rate_limited else None
+
+def _decode(record: Dict[bytes, bytes]) -> Dict[str, float]:
+    return {field.decode("utf-8"): float(value) for field, value in record.items()}
+
+async def get_rate_limit_state(redis_client: aioredis.Redis = Depends(get_redis)) -> Dict[str, Any]:
+    """Current bucket levels, block and counters of every rate-limited model"""
+    models = sorted(settings.MODEL_RATE_LIMITS)
+    pipe = redis_client.pipeline(transaction=False)
+    for model in models:
+        pipe.hgetall(rate_limit_key(model))
+        pipe.hgetall(rate_limit_stats_key(model))
+    pipe.time()
+    replies = await pipe.execute()
+    seconds, microseconds = replies[-1]
+    now_ms = seconds * 1000 + microseconds // 1000
+
+    state = {}
+    for index, model in enumerate(models):
+        buckets, stats = _decode(replies[2 * index]), _decode(replies[2 * index + 1])
+        limits = _limits(model)
+        elapsed = max(now_ms - buckets.get("ts", now_ms), 0)
+        state[model] = {
+            "limits": limits,
+            "requests_available": min(limits["rpm"], buckets.get("requests", limits["rpm"]) + elapsed * limits["rpm"] / 60000),
+            "tokens_available": min(limits["tpm"], buckets.get("tokens", limits["tpm"]) + elapsed * limits["tpm"] / 60000),
+            "blocked_for_seconds": max(buckets.get("blocked_until", 0) - now_ms, 0) / 1000,
+            "stats": stats,
+        }
+    return state
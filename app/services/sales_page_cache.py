@@ -0,0 +1,134 @@
+import hashlib
+import json
+import logging
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from redis import Redis
+
+from app.core import compression
+from app.core.config import settings
+from app.core.redis import create_sync_redis
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Query parameters that identify a visit rather than a page
+TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "mc_cid", "mc_eid", "_ga", "ref"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+def normalize_url(url: str) -> str:
+    """Reduce a sales page URL to a canonical form so equivalent links share a cache entry"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or "https"
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith("utm_") and name.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+def sales_page_cache_key(url: str) -> str:
+    return f"sales_page:{hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()}"
+
+def sales_page_refresh_key(url: str) -> str:
+    """Marker held while a background refresh of the page is queued or running"""
+    return f"{sales_page_cache_key(url)}:refreshing"
+
+class SalesPageCache:
+    """
+    Extracted sales pages by normalized URL, served stale-while-revalidate
+
+    Entries are fresh for SALES_PAGE_CACHE_FRESH_SECONDS. After that they are
+    still served, up to SALES_PAGE_CACHE_MAX_STALE_SECONDS, while one
+    background refresh replaces them, so only a cold miss waits on the model.
+
+    Each entry keeps the page's ETag, Last-Modified and content hash, so a
+    refresh can revalidate the page and, if it hasn't changed, keep the
+    extraction without calling the model.
+    """
+
+    def __init__(self, client: Optional[Redis] = None):
+        self.client = client or create_sync_redis()
+
+    def get_entry(self, url: str) -> Optional[Dict]:
+        """The raw cache entry of a page (data, validators, timestamps), or None"""
+        try:
+            raw = self.client.get(sales_page_cache_key(url))
+        except Exception as e:
+            logger.warning(f"Error reading sales page cache for {url}: {str(e)}")
+            return None
+        if raw is None:
+            return None
+        return json.loads(compression.decompress(raw))
+
+    def get(self, url: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """Return (data, "fresh" | "stale") for a cached page, or (None, None) on a miss"""
+        entry = self.get_entry(url)
+        if entry is None:
+            return None, None
+        # Entries written before revalidation existed only have extracted_at
+        age = time.time() - entry.get("checked_at", entry["extracted_at"])
+        fresh = age < settings.SALES_PAGE_CACHE_FRESH_SECONDS and not entry.get("changed")
+        return entry["data"], "fresh" if fresh else "stale"
+
+    def _write(self, url: str, entry: Dict):
+        pipe = self.client.pipeline()
+        pipe.set(
+            sales_page_cache_key(url),
+            compression.compress(json.dumps(entry).encode("utf-8")),
+            ex=settings.SALES_PAGE_CACHE_MAX_STALE_SECONDS
+        )
+        pipe.delete(sales_page_refresh_key(url))
+        pipe.execute()
+
+    def set(self, url: str, data: Dict, validators: Optional[Dict[str, str]] = None):
+        """Store a new extraction with the validators of the page it came from"""
+        now = time.time()
+        entry = {"url": normalize_url(url), "extracted_at": now, "checked_at": now, "validators": validators or {}, "data": data}
+        try:
+            self._write(url, entry)
+        except Exception as e:
+            logger.warning(f"Error writing sales page cache for {url}: {str(e)}")
+
+    def revalidated(self, url: str, entry: Dict, validators: Dict[str, str]):
+        """Keep an entry's extraction for a page confirmed unchanged, fresh again from now"""
+        entry = {**entry, "checked_at": time.time(), "validators": {**entry.get("validators", {}), **validators}, "changed": False}
+        try:
+            self._write(url, entry)
+        except Exception as e:
+            logger.warning(f"Error revalidating sales page cache for {url}: {str(e)}")
+
+    def mark_changed(self, url: str, entry: Dict):
+        """Flag an entry whose page content changed, so it is served as stale until re-extracted"""
+        try:
+            self.client.set(
+                sales_page_cache_key(url),
+                compression.compress(json.dumps({**entry, "changed": True}).encode("utf-8")),
+                keepttl=True
+            )
+        except Exception as e:
+            logger.warning(f"Error marking sales page {url} as changed: {str(e)}")
+
+    def claim_refresh(self, url: str) -> bool:
+        """Whether the caller should schedule a refresh; only one is scheduled per page at a time"""
+        try:
+            return bool(self.client.set(sales_page_refresh_key(url), b"1", nx=True, ex=settings.SALES_PAGE_REFRESH_LOCK_SECONDS))
+        except Exception as e:
+            logger.warning(f"Error claiming sales page refresh for {url}: {str(e)}")
+            return False
+
+    def release_refresh(self, url: str):
+        try:
+            self.client.delete(sales_page_refresh_key(url))
+        except Exception as e:
+            logger.warning(f"Error releasing sales page refresh for {url}: {str(e)}")
+
+# Create a singleton instance
+sales_page_cache = SalesPageCache()
@@ -0,0 +1,87 @@
+import re
+from typing import Any, Dict, List, Optional
+
+from app.models.sales_page import SalesPageChunkOutput, SalesPageOutput
+
+# Fields merged as the union of every chunk's items
+LIST_FIELDS = ("key_benefits", "features", "visual_elements_to_include")
+SOCIAL_PROOF_LISTS = ("testimonials", "media_mentions")
+# Fields taken from the chunk most confident about them
+SCALAR_FIELDS = ("product_name", "tagline", "problem_addressed", "target_audience", "call_to_action", "brand_voice", "compliance_notes")
+# Used for fields a chunk filled without reporting a confidence
+DEFAULT_CONFIDENCE = 0.5
+NON_WORD = re.compile(r"\W+")
+
+def _fingerprint(value: Any) -> str:
+    return NON_WORD.sub(" ", str(value).lower()).strip()
+
+def _union(lists: List[List[Any]]) -> List[Any]:
+    """Items of every list in order, keeping one of items that differ only in case or punctuation"""
+    seen = set()
+    merged = []
+    for items in lists:
+        for item in items or []:
+            fingerprint = _fingerprint(item)
+            if fingerprint and fingerprint not in seen:
+                seen.add(fingerprint)
+                merged.append(item)
+    return merged
+
+def _most_confident(candidates: List[tuple]) -> Any:
+    """The value with the highest confidence from (value, confidence) pairs; earlier chunks win ties"""
+    best, best_confidence = None, -1.0
+    for value, confidence in candidates:
+        if value and confidence > best_confidence:
+            best, best_confidence = value, confidence
+    return best
+
+def merge_sales_page_chunks(chunks: List[SalesPageChunkOutput], fallback_name: Optional[str] = None) -> SalesPageOutput:
+    """
+    Merge partial extractions of a long page's chunks, in page order
+
+    Lists (benefits, features, visual elements, testimonials, media mentions)
+    are unioned and deduplicated. Scalars, offer details and sales numbers come
+    from the chunk most confident about them; a nested field uses the
+    confidence reported for its parent (e.g. "offer") unless it has its own
+    (e.g. "offer.discount").
+    """
+    def confidence(chunk: SalesPageChunkOutput, field: str) -> float:
+        parent = field.split(".")[0]
+        return float(chunk.confidence.get(field, chunk.confidence.get(parent, DEFAULT_CONFIDENCE)))
+
+    merged: Dict[str, Any] = {}
+    for field in LIST_FIELDS:
+        merged[field] = _union([getattr(chunk, field) for chunk in chunks])
+    for field in SCALAR_FIELDS:
+        merged[field] = _most_confident([(getattr(chunk, field), confidence(chunk, field)) for chunk in chunks]) or ""
+
+    offer_fields = []
+    for chunk in chunks:
+        offer_fields.extend(name for name in chunk.offer if name not in offer_fields)
+    merged["offer"] = {
+        name: _most_confident([(chunk.offer.get(name), confidence(chunk, f"offer.{name}")) for chunk in chunks])
+        for name in offer_fields
+    }
+    merged["offer"] = {name: value for name, value in merged["offer"].items() if value}
+
+    social_proof: Dict[str, Any] = {}
+    for name in SOCIAL_PROOF_LISTS:
+        social_proof[name] = _union([chunk.social_proof.get(name) for chunk in chunks if isinstance(chunk.social_proof.get(name), list)])
+    for chunk in chunks:
+        for name in chunk.social_proof:
+            if name not in social_proof:
+                social_proof[name] = _most_confident([
+                    (other.social_proof.get(name), confidence(other, f"social_proof.{name}")) for other in chunks
+                ])
+    merged["social_proof"] = {name: value for name, value in social_proof.items() if value}
+
+    additional_info: Dict[str, Any] = {}
+    for chunk in chunks:
+        for name, value in (chunk.additional_info or {}).items():
+            if value and name not in additional_info:
+                additional_info[name] = value
+    merged["additional_info"] = additional_info
+
+    if not merged["product_name"]:
+        merged["product_name"] = fallback_name or ""
+    return SalesPageOutput.model_validate(merged)
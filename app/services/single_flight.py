@@ -0,0 +1,145 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+from redis import Redis
+
+from app.core.config import settings
+from app.core.redis import create_sync_redis
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Only touch the lock while it is still ours; a lock that expired may belong to another worker now
+EXTEND_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+def flight_lock_key(key: str) -> str:
+    return f"flight:{key}:lock"
+
+def flight_result_key(key: str) -> str:
+    return f"flight:{key}:result"
+
+def flight_channel(key: str) -> str:
+    return f"flight:{key}:done"
+
+class SingleFlightError(Exception):
+    """The computation another worker ran on our behalf failed"""
+
+class SingleFlight:
+    """
+    Cluster-wide request coalescing for identical work
+
+    The first caller for a key takes a Redis lock and computes the result;
+    callers arriving meanwhile wait for its notification and reuse the result
+    instead of repeating the work. The lock is a lease the leader keeps
+    extending, so if the leader's worker dies it expires within
+    SINGLE_FLIGHT_LOCK_TTL seconds and one waiter takes over.
+
+    Outcomes are tagged with their leader's lock token. A failure is only
+    delivered to callers that saw that leader holding the lock, so one
+    transient error doesn't fail identical calls made after it.
+    """
+
+    def __init__(self, client: Optional[Redis] = None):
+        self.client = client or create_sync_redis()
+        self._extend = self.client.register_script(EXTEND_LOCK_SCRIPT)
+        self._release = self.client.register_script(RELEASE_LOCK_SCRIPT)
+
+    def _keep_alive(self, key: str, token: str, stop: threading.Event):
+        ttl_ms = settings.SINGLE_FLIGHT_LOCK_TTL * 1000
+        while not stop.wait(settings.SINGLE_FLIGHT_LOCK_TTL / 3):
+            try:
+                if not self._extend(keys=[flight_lock_key(key)], args=[token, ttl_ms]):
+                    logger.warning(f"Lost single-flight lock for {key}")
+                    return
+            except Exception as e:
+                logger.warning(f"Error extending single-flight lock for {key}: {str(e)}")
+
+    def _lead(self, key: str, token: str, compute: Callable[[], Dict]) -> Dict:
+        stop = threading.Event()
+        keeper = threading.Thread(target=self._keep_alive, args=(key, token, stop), daemon=True)
+        keeper.start()
+        outcome = None
+        try:
+            value = compute()
+            outcome = {"token": token, "value": value}
+            return value
+        except Exception as e:
+            outcome = {"token": token, "error": str(e)}
+            raise
+        finally:
+            stop.set()
+            try:
+                if outcome is not None:
+                    pipe = self.client.pipeline()
+                    pipe.set(flight_result_key(key), json.dumps(outcome), ex=settings.SINGLE_FLIGHT_RESULT_TTL)
+                    pipe.publish(flight_channel(key), b"1")
+                    pipe.execute()
+                self._release(keys=[flight_lock_key(key)], args=[token])
+            except Exception as e:
+                logger.warning(f"Error publishing single-flight result for {key}: {str(e)}")
+
+    def _outcome(self, key: str) -> Optional[Dict]:
+        raw = self.client.get(flight_result_key(key))
+        return json.loads(raw) if raw is not None else None
+
+    def do(self, key: str, compute: Callable[[], Dict], timeout: Optional[float] = None, bypass: bool = False) -> Dict:
+        """
+        Return compute()'s result, computing it at most once across the cluster for concurrent callers
+
+        A result stored by a recent flight is reused, unless bypass is set; then
+        only the outcome of a flight that was running when we arrived is used.
+        """
+        deadline = time.monotonic() + (timeout or settings.SINGLE_FLIGHT_WAIT_TIMEOUT)
+        token = uuid.uuid4().hex
+        # Lock tokens of the leaders we waited on; only their failures are ours
+        joined = set()
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        try:
+            # Subscribe before checking, so a notification can't slip in between
+            pubsub.subscribe(flight_channel(key))
+            while True:
+                outcome = self._outcome(key)
+                if outcome is not None:
+                    ours = outcome.get("token") in joined
+                    if "error" in outcome and ours:
+                        raise SingleFlightError(outcome["error"])
+                    if "value" in outcome and (ours or not bypass):
+                        logger.info(f"Reused in-flight result for {key}")
+                        return outcome["value"]
+
+                if self.client.set(flight_lock_key(key), token, nx=True, ex=settings.SINGLE_FLIGHT_LOCK_TTL):
+                    break
+                leader = self.client.get(flight_lock_key(key))
+                if leader is not None:
+                    joined.add(leader.decode("utf-8") if isinstance(leader, bytes) else leader)
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Waited long enough; do the work ourselves rather than fail the task
+                    logger.warning(f"Timed out waiting on single-flight leader for {key}, computing it here")
+                    return compute()
+
+                # Wake on the leader's notification, or after a while to check whether its lock expired
+                pubsub.get_message(timeout=min(remaining, settings.SINGLE_FLIGHT_LOCK_TTL / 3))
+        finally:
+            pubsub.close()
+
+        return self._lead(key, token, compute)
+
+# Create a singleton instance
+single_flight = SingleFlight()
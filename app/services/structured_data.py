@@ -0,0 +1,184 @@
+import json
+import logging
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.models.sales_page import SalesPageNarrativeOutput, SalesPageOutput
+from app.services.page_parser import ParsedPage
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PRODUCT_TYPES = {"Product", "ProductGroup", "IndividualProduct", "ProductModel"}
+# Testimonials taken from JSON-LD reviews
+MAX_REVIEWS = 5
+# Offer details structured data states reliably; terms like discounts and
+# deadlines come from the page copy
+STRUCTURED_OFFER_FIELDS = ("price", "price_range", "availability")
+
+def _types(node: Dict[str, Any]) -> List[str]:
+    types = node.get("@type", [])
+    if isinstance(types, str):
+        return [types]
+    return [t for t in types if isinstance(t, str)] if isinstance(types, list) else []
+
+def _nodes(value: Any) -> Iterator[Dict[str, Any]]:
+    """Every JSON-LD object in a document, including those inside @graph"""
+    if isinstance(value, list):
+        for item in value:
+            yield from _nodes(item)
+    elif isinstance(value, dict):
+        yield value
+        if "@graph" in value:
+            yield from _nodes(value["@graph"])
+
+def _text(value: Any) -> str:
+    """A schema.org value as text: names of things, first of lists, last segment of enum URLs"""
+    if isinstance(value, list):
+        return _text(value[0]) if value else ""
+    if isinstance(value, dict):
+        return _text(value.get("name") or value.get("url") or value.get("@id") or "")
+    if value is None:
+        return ""
+    text = str(value).strip()
+    if text.startswith("http") and "schema.org/" in text:
+        return text.rsplit("/", 1)[-1]
+    return text
+
+def _images(value: Any) -> List[str]:
+    if isinstance(value, list):
+        return [image for item in value for image in _images(item)]
+    if isinstance(value, dict):
+        return _images(value.get("url") or value.get("contentUrl"))
+    return [value] if isinstance(value, str) and value else []
+
+def _product_node(page: ParsedPage) -> Optional[Dict[str, Any]]:
+    for body in page.json_ld:
+        try:
+            document = json.loads(body)
+        except ValueError:
+            # Themes often emit raw newlines inside JSON-LD strings
+            try:
+                document = json.loads(body, strict=False)
+            except ValueError as e:
+                logger.debug(f"Skipping unparseable JSON-LD: {str(e)}")
+                continue
+        for node in _nodes(document):
+            if PRODUCT_TYPES & set(_types(node)):
+                return node
+    return None
+
+def _from_json_ld(product: Dict[str, Any]) -> Dict[str, Any]:
+    fields: Dict[str, Any] = {"offer": {}, "social_proof": {}, "additional_info": {}}
+    fields["product_name"] = _text(product.get("name"))
+    if product.get("description"):
+        fields["additional_info"]["description"] = _text(product["description"])
+    if product.get("brand"):
+        fields["additional_info"]["brand"] = _text(product["brand"])
+    if _images(product.get("image")):
+        fields["additional_info"]["images"] = _images(product.get("image"))
+
+    offers = product.get("offers")
+    offers = offers if isinstance(offers, list) else [offers] if isinstance(offers, dict) else []
+    # Offers may also be given as bare URLs or strings
+    for offer in (offer for offer in offers if isinstance(offer, dict)):
+        currency = _text(offer.get("priceCurrency"))
+        if offer.get("price") is not None and "price" not in fields["offer"]:
+            fields["offer"]["price"] = f"{_text(offer['price'])} {currency}".strip()
+        if offer.get("lowPrice") is not None and offer.get("highPrice") is not None and "price_range" not in fields["offer"]:
+            fields["offer"]["price_range"] = f"{_text(offer['lowPrice'])}-{_text(offer['highPrice'])} {currency}".strip()
+        if offer.get("availability") and "availability" not in fields["offer"]:
+            fields["offer"]["availability"] = _text(offer["availability"])
+        # Themes set this on every product, often a year ahead, so it is no sign of a limited-time offer
+        if offer.get("priceValidUntil") and "price_valid_until" not in fields["additional_info"]:
+            fields["additional_info"]["price_valid_until"] = _text(offer["priceValidUntil"])
+
+    rating = product.get("aggregateRating")
+    if isinstance(rating, dict):
+        if rating.get("ratingValue") is not None:
+            fields["social_proof"]["rating"] = _text(rating["ratingValue"])
+        count = rating.get("reviewCount") or rating.get("ratingCount")
+        if count is not None:
+            fields["social_proof"]["review_count"] = _text(count)
+
+    reviews = product.get("review")
+    reviews = reviews if isinstance(reviews, list) else [reviews] if isinstance(reviews, dict) else []
+    testimonials = [_text(review.get("reviewBody")) for review in reviews if isinstance(review, dict) and review.get("reviewBody")]
+    if testimonials:
+        fields["social_proof"]["testimonials"] = testimonials[:MAX_REVIEWS]
+    return fields
+
+def extract_structured_fields(page: ParsedPage) -> Dict[str, Any]:
+    """
+    SalesPageOutput fields read deterministically from a page's structured data
+
+    schema.org Product JSON-LD is preferred, then OpenGraph and product meta
+    tags, then microdata. Yields product_name, offer price and availability,
+    rating and review count, review testimonials, and brand, description,
+    images and price validity under additional_info. Missing fields are left out,
+    and structured data that can't be read yields no fields at all.
+    """
+    try:
+        return _extract_structured_fields(page)
+    except Exception as e:
+        logger.warning(f"Ignoring malformed structured data: {str(e)}")
+        return {}
+
+def _extract_structured_fields(page: ParsedPage) -> Dict[str, Any]:
+    product = _product_node(page)
+    fields = _from_json_ld(product) if product else {"offer": {}, "social_proof": {}, "additional_info": {}}
+    microdata: Dict[str, str] = {}
+    for name, value in page.microdata:
+        microdata.setdefault(name, value)
+    meta = page.meta
+
+    # Microdata names are only trusted on pages that also mark up a price
+    if not fields.get("product_name"):
+        fields["product_name"] = meta.get("og:title") or (microdata.get("name") if "price" in microdata else "") or ""
+    if "price" not in fields["offer"]:
+        amount = meta.get("product:price:amount") or meta.get("og:price:amount") or microdata.get("price")
+        currency = meta.get("product:price:currency") or meta.get("og:price:currency") or microdata.get("priceCurrency", "")
+        if amount:
+            fields["offer"]["price"] = f"{amount} {currency}".strip()
+    if "availability" not in fields["offer"] and (meta.get("product:availability") or microdata.get("availability")):
+        fields["offer"]["availability"] = _text(meta.get("product:availability") or microdata.get("availability"))
+    if "rating" not in fields["social_proof"] and microdata.get("ratingValue"):
+        fields["social_proof"]["rating"] = microdata["ratingValue"]
+    if "review_count" not in fields["social_proof"] and (microdata.get("reviewCount") or microdata.get("ratingCount")):
+        fields["social_proof"]["review_count"] = microdata.get("reviewCount") or microdata.get("ratingCount")
+    if "brand" not in fields["additional_info"] and microdata.get("brand"):
+        fields["additional_info"]["brand"] = microdata["brand"]
+    if "images" not in fields["additional_info"] and meta.get("og:image"):
+        fields["additional_info"]["images"] = [meta["og:image"]]
+    if "description" not in fields["additional_info"] and (meta.get("og:description") or page.description):
+        fields["additional_info"]["description"] = meta.get("og:description") or page.description
+
+    return {name: value for name, value in fields.items() if value}
+
+def has_fast_path(fields: Dict[str, Any]) -> bool:
+    """Whether structured data covers enough for the narrative-only extraction"""
+    return bool(fields.get("product_name")) and bool(fields.get("offer", {}).get("price"))
+
+def needs_social_proof(fields: Dict[str, Any]) -> bool:
+    """Whether the model must read social proof from the copy, as structured data has no ratings or reviews"""
+    return not fields.get("social_proof")
+
+def combine_with_narrative(fields: Dict[str, Any], narrative: SalesPageNarrativeOutput) -> SalesPageOutput:
+    """Complete structured-data fields with the model's narrative fields into a SalesPageOutput"""
+    data = narrative.model_dump(exclude={"social_proof"})
+    data["product_name"] = fields["product_name"]
+    # Page-stated prices win over the model's reading of the copy; offer terms are the model's
+    data["offer"] = {name: value for name, value in narrative.offer.items() if value}
+    data["offer"].update({name: value for name, value in fields.get("offer", {}).items() if name in STRUCTURED_OFFER_FIELDS})
+    social_proof = dict(fields.get("social_proof", {}))
+    read = narrative.social_proof or {}
+    testimonials = list(social_proof.get("testimonials", []))
+    if isinstance(read.get("testimonials"), list):
+        testimonials += [testimonial for testimonial in read["testimonials"] if testimonial not in testimonials]
+    if testimonials:
+        social_proof["testimonials"] = testimonials
+    for name in ("media_mentions", "sales_numbers"):
+        if read.get(name):
+            social_proof[name] = read[name]
+    data["social_proof"] = social_proof
+    data["additional_info"] = fields.get("additional_info", {})
+    return SalesPageOutput.model_validate(data)
@@ -0,0 +1,143 @@
+import base64
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.services.supabase_service import supabase_service
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class SQLiteTaskArchive:
+    """Cold tier for completed task documents kept in a local SQLite file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS task_archive ("
+                "task_id TEXT PRIMARY KEY, "
+                "document BLOB NOT NULL, "
+                "archived_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection per call keeps this safe to use from worker and threadpool threads
+        return sqlite3.connect(self.path, timeout=5)
+
+    def save(self, task_id: str, compressed: bytes):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO task_archive (task_id, document, archived_at) VALUES (?, ?, ?)",
+                (task_id, compressed, time.time())
+            )
+
+    def load(self, task_id: str) -> Optional[bytes]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT document FROM task_archive WHERE task_id = ?", (task_id,)).fetchone()
+        return row[0] if row else None
+
+    def load_many(self, task_ids: List[str]) -> Dict[str, bytes]:
+        placeholders = ", ".join("?" for _ in task_ids)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT task_id, document FROM task_archive WHERE task_id IN ({placeholders})",
+                list(task_ids)
+            ).fetchall()
+        return {task_id: document for task_id, document in rows}
+
+class SupabaseTaskArchive:
+    """Cold tier for completed task documents kept in a Supabase table"""
+
+    table = "task_archive"
+
+    def save(self, task_id: str, compressed: bytes):
+        if not supabase_service.client:
+            logger.error("Supabase client not initialized. Cannot archive task.")
+            return
+        supabase_service.client.table(self.table).upsert({
+            "task_id": task_id,
+            # PostgREST only speaks JSON, so the compressed bytes travel as base64
+            "document": base64.b64encode(compressed).decode("ascii")
+        }).execute()
+
+    def load(self, task_id: str) -> Optional[bytes]:
+        if not supabase_service.client:
+            return None
+        response = supabase_service.client.table(self.table).select("document").eq("task_id", task_id).execute()
+        if response.data:
+            return base64.b64decode(response.data[0]["document"])
+        return None
+
+    def load_many(self, task_ids: List[str]) -> Dict[str, bytes]:
+        if not supabase_service.client:
+            return {}
+        response = supabase_service.client.table(self.table).select("task_id, document").in_("task_id", list(task_ids)).execute()
+        return {row["task_id"]: base64.b64decode(row["document"]) for row in response.data or []}
+
+class TaskArchive:
+    """
+    Compressed cold tier for completed task results
+
+    Completed documents are written here when the task completes, so once the
+    hot Redis copy expires the result is still served from the archive.
+    """
+
+    def __init__(self, backend: str):
+        self.backend = None
+        try:
+            if backend == "sqlite":
+                self.backend = SQLiteTaskArchive(settings.TASK_ARCHIVE_SQLITE_PATH)
+            elif backend == "supabase":
+                self.backend = SupabaseTaskArchive()
+            elif backend != "none":
+                logger.warning(f"Unknown task archive backend '{backend}'. Archiving is disabled.")
+        except Exception as e:
+            logger.error(f"Error initializing {backend} task archive: {str(e)}")
+            self.backend = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def save(self, task_id: str, document: str):
+        """Compress and archive a task document, never raising"""
+        if not self.enabled:
+            return
+        try:
+            self.backend.save(task_id, zlib.compress(document.encode("utf-8"), 6))
+        except Exception as e:
+            logger.error(f"Error archiving task {task_id}: {str(e)}")
+
+    def load(self, task_id: str) -> Optional[str]:
+        """Load an archived task document, or None if it isn't archived"""
+        if not self.enabled:
+            return None
+        try:
+            compressed = self.backend.load(task_id)
+        except Exception as e:
+            logger.error(f"Error loading archived task {task_id}: {str(e)}")
+            return None
+        return zlib.decompress(compressed).decode("utf-8") if compressed else None
+
+    def load_many(self, task_ids: List[str]) -> Dict[str, str]:
+        """Load the archived documents of several tasks in one query"""
+        if not self.enabled or not task_ids:
+            return {}
+        try:
+            found = self.backend.load_many(task_ids)
+        except Exception as e:
+            logger.error(f"Error loading {len(task_ids)} archived tasks: {str(e)}")
+            return {}
+        return {task_id: zlib.decompress(compressed).decode("utf-8") for task_id, compressed in found.items()}
+
+# Create a singleton instance
+task_archive = TaskArchive(settings.TASK_ARCHIVE_BACKEND)
@@ -0,0 +1,377 @@
+import json
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import Depends
+from fastapi.concurrency import run_in_threadpool
+from redis import Redis
+from redis import asyncio as aioredis
+
+from app.core import compression
+from app.core.config import settings
+from app.core.redis import create_sync_redis, get_redis
+from app.models.common import TaskResult
+from app.services.task_archive import task_archive
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+# How long (in seconds) a task record is kept in Redis after entering each status
+STATUS_TTLS = {
+    "processing": settings.TASK_TTL_PROCESSING,
+    "completed": settings.TASK_TTL_COMPLETED,
+    "failed": settings.TASK_TTL_FAILED,
+}
+DEFAULT_TTL = settings.TASK_TTL_FAILED
+
+def task_key(task_id: str) -> str:
+    """Redis hash holding the status metadata of a task"""
+    return f"task:{task_id}"
+
+def task_result_key(task_id: str) -> str:
+    """Redis string holding the, possibly compressed, TaskResult document of a task"""
+    return f"task:{task_id}:result"
+
+def task_usage_key(task_id: str) -> str:
+    """Redis hash of the usage counters and cascade paths of a task's model calls"""
+    return f"task:{task_id}:usage"
+
+def task_events_key(task_id: str) -> str:
+    """Redis stream of status and progress events for a task"""
+    return f"task:{task_id}:events"
+
+def user_tasks_key(user_id: str) -> str:
+    """Sorted set of a user's task IDs, scored by enqueue time"""
+    return f"user:{user_id}:tasks"
+
+def user_events_key(user_id: str) -> str:
+    """Redis stream announcing every task enqueued for a user"""
+    return f"user:{user_id}:events"
+
+# Approximate cap on entries kept in each task's event stream
+EVENT_STREAM_MAXLEN = 200
+
+# Most recent tasks kept in each user's task index
+USER_INDEX_MAX = 500
+
+def _queue_stream_append(pipe, key: str, event: str, data: Dict[str, Any], ttl: int):
+    """Queue an append to an event stream, refreshing its expiry"""
+    pipe.xadd(key, {"event": event, "data": json.dumps(data)}, maxlen=EVENT_STREAM_MAXLEN, approximate=True)
+    pipe.expire(key, ttl)
+
+def _queue_event(pipe, task_id: str, event: str, data: Dict[str, Any], ttl: int):
+    """Queue an append to the task's event stream, expiring with the task"""
+    _queue_stream_append(pipe, task_events_key(task_id), event, data, ttl)
+
+def _queue_progress(pipe, task_id: str, step: str, index: int, total: int, state: str, details: Optional[Dict[str, Any]] = None):
+    """Queue a progress event and record the current step on the task hash"""
+    progress = {
+        "step": step,
+        "index": index,
+        "total": total,
+        "state": state,
+        "details": details or {},
+        "timestamp": time.time(),
+    }
+    key = task_key(task_id)
+    pipe.hset(key, mapping={"step": step, "step_state": state, "updated_at": repr(progress["timestamp"])})
+    pipe.hincrby(key, "version", 1)
+    _queue_event(pipe, task_id, "progress", progress, STATUS_TTLS["processing"])
+
+def _text(value) -> Optional[str]:
+    """Decode a raw Redis reply value; the clients return bytes so payloads can stay compressed"""
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+def _load_document(document: bytes) -> Dict[str, Any]:
+    """Parse a stored, possibly compressed, TaskResult document"""
+    return json.loads(compression.decompress(document))
+
+# Hash fields returned for each task by bulk status lookups
+STATUS_FIELDS = ["status", "error", "step", "step_state", "version"]
+
+def _compact_status(values: List[Optional[bytes]], document: Optional[bytes], include_result: bool) -> Optional[Dict[str, Any]]:
+    """Build a compact status entry from an HMGET of STATUS_FIELDS and the task's document"""
+    fields = dict(zip(STATUS_FIELDS, values))
+    if not fields["status"]:
+        return None
+    entry = {name: _text(fields[name]) for name in STATUS_FIELDS if fields[name]}
+    if include_result and document:
+        entry["result"] = _load_document(document).get("result")
+    return entry
+
+def _parse_events(response) -> List[Tuple[str, str, str, Dict[str, Any]]]:
+    """Flatten an XREAD reply into (stream key, id, event, data) tuples"""
+    events = []
+    for key, entries in response or []:
+        for entry_id, fields in entries:
+            events.append((
+                _text(key),
+                _text(entry_id),
+                _text(fields.get(b"event", b"update")),
+                json.loads(fields.get(b"data", b"{}"))
+            ))
+    return events
+
+def _queue_write(pipe, task_id: str, status: str, result: Optional[Dict] = None, error: Optional[str] = None) -> str:
+    """
+    Queue a state write on a sync or async pipeline and return the document
+
+    Status metadata lives in a small hash whose version is bumped on every
+    write. The full TaskResult document is kept apart and only written when
+    there is a result to store, compressed when it is large.
+    """
+    key = task_key(task_id)
+    result_key = task_result_key(task_id)
+    payload = json.dumps(TaskResult(status=status, result=result, error=error).model_dump())
+    ttl = STATUS_TTLS.get(status, DEFAULT_TTL)
+    now = repr(time.time())
+
+    if result is not None:
+        pipe.set(result_key, compression.compress(payload.encode("utf-8")), ex=ttl)
+    else:
+        pipe.delete(result_key)
+
+    fields = {"status": status, "updated_at": now}
+    if error is not None:
+        fields["error"] = error
+    else:
+        pipe.hdel(key, "error")
+    pipe.hset(key, mapping=fields)
+    pipe.hsetnx(key, "created_at", now)
+    pipe.hincrby(key, "version", 1)
+    pipe.expire(key, ttl)
+    _queue_event(pipe, task_id, "update", {"status": status, "error": error}, ttl)
+    return payload
+
+def _parse_meta(record: Dict[bytes, bytes]) -> Optional[Dict[str, str]]:
+    """Decode a task's status metadata hash; None unless it has a status"""
+    if not record or b"status" not in record:
+        return None
+    return {_text(name): _text(value) for name, value in record.items()}
+
+def _parse_record(record: Dict[bytes, bytes], document: Optional[bytes]) -> Optional[Dict[str, Any]]:
+    """Turn a task's metadata and document into the TaskResult dict returned to clients"""
+    if document:
+        return _load_document(document)
+    if not record:
+        return None
+    return TaskResult(
+        status=_text(record.get(b"status", b"unknown")),
+        error=_text(record.get(b"error"))
+    ).model_dump()
+
+class TaskStateStore:
+    """Synchronous task state store used by the Celery workers"""
+
+    def __init__(self, client: Optional[Redis] = None):
+        self.client = client or create_sync_redis()
+
+    def _write(self, task_id: str, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        pipe = self.client.pipeline()
+        payload = _queue_write(pipe, task_id, status, result=result, error=error)
+        pipe.execute()
+
+        # Completed results outlive their Redis TTL in the cold tier
+        if result is not None:
+            task_archive.save(task_id, payload)
+
+    def set_status(self, task_id: str, status: str):
+        """Record a status transition, dropping any result left from an earlier attempt"""
+        self._write(task_id, status)
+
+    def set_result(self, task_id: str, result: Dict):
+        """Mark a task completed and store its result"""
+        self._write(task_id, "completed", result=result)
+
+    def set_error(self, task_id: str, error: str):
+        """Mark a task failed and store the error message"""
+        self._write(task_id, "failed", error=error)
+
+    def update(self, task_id: str, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        """Write whichever kind of update the arguments describe"""
+        self._write(task_id, status, result=result, error=error)
+
+    def add_progress(self, task_id: str, step: str, index: int, total: int, state: str = "started", details: Optional[Dict[str, Any]] = None):
+        """Append a progress event for one step of a multi-step task"""
+        pipe = self.client.pipeline()
+        _queue_progress(pipe, task_id, step, index, total, state, details)
+        pipe.execute()
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Get the current state of a task, or None if it doesn't exist in Redis"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hgetall(task_key(task_id))
+        pipe.get(task_result_key(task_id))
+        record, document = pipe.execute()
+        return _parse_record(record, document)
+
+    def get_user_id(self, task_id: str) -> Optional[str]:
+        """The user a task was registered for, if any"""
+        return _text(self.client.hget(task_key(task_id), "user_id"))
+
+class AsyncTaskStateStore:
+    """Asyncio task state store used by the API, backed by the shared pool"""
+
+    def __init__(self, client: aioredis.Redis):
+        self.client = client
+
+    async def _write(self, task_id: str, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        pipe = self.client.pipeline()
+        payload = _queue_write(pipe, task_id, status, result=result, error=error)
+        await pipe.execute()
+
+        # Completed results outlive their Redis TTL in the cold tier
+        if result is not None and task_archive.enabled:
+            await run_in_threadpool(task_archive.save, task_id, payload)
+
+    async def set_status(self, task_id: str, status: str):
+        """Record a status transition, dropping any result left from an earlier attempt"""
+        await self._write(task_id, status)
+
+    async def set_result(self, task_id: str, result: Dict):
+        """Mark a task completed and store its result"""
+        await self._write(task_id, "completed", result=result)
+
+    async def set_error(self, task_id: str, error: str):
+        """Mark a task failed and store the error message"""
+        await self._write(task_id, "failed", error=error)
+
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Get the current state of a task, or None if it doesn't exist in Redis"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hgetall(task_key(task_id))
+        pipe.get(task_result_key(task_id))
+        record, document = await pipe.execute()
+        return _parse_record(record, document)
+
+    async def get_meta(self, task_id: str) -> Optional[Dict[str, str]]:
+        """Get a task's status metadata (status, step, timestamps, version) without its payload"""
+        return _parse_meta(await self.client.hgetall(task_key(task_id)))
+
+    async def get_document(self, task_id: str) -> Optional[bytes]:
+        """
+        Get a task's TaskResult document exactly as stored, possibly compressed
+
+        This lets the HTTP layer pass it through without parsing it.
+        """
+        return await self.client.get(task_result_key(task_id))
+
+    async def get_task_type(self, task_id: str) -> Optional[str]:
+        """Get the type a task was registered with, if any"""
+        return _text(await self.client.hget(task_key(task_id), "type"))
+
+    async def get_archived(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Get a task from the cold tier, or None if it isn't archived"""
+        if not task_archive.enabled:
+            return None
+        document = await run_in_threadpool(task_archive.load, task_id)
+        return json.loads(document) if document else None
+
+    async def get_with_archive(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Get the state of a task, falling back to the cold tier once it left Redis"""
+        task_data = await self.get(task_id)
+        if task_data is None:
+            task_data = await self.get_archived(task_id)
+        return task_data
+
+    async def get_many(self, task_ids: List[str], include_result: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        Get compact statuses for many tasks in a single pipelined round trip
+
+        Tasks that already left Redis are looked up in the cold tier in one
+        batch; tasks found nowhere are reported as "not_found".
+        """
+        task_ids = list(dict.fromkeys(task_ids))
+        
+        pipe = self.client.pipeline(transaction=False)
+        for task_id in task_ids:
+            pipe.hmget(task_key(task_id), STATUS_FIELDS)
+            if include_result:
+                pipe.get(task_result_key(task_id))
+        rows = await pipe.execute()
+        
+        # Each task took one reply, or two when its document was fetched too
+        step = 2 if include_result else 1
+        statuses = {}
+        missing = []
+        for position, task_id in enumerate(task_ids):
+            values = rows[position * step]
+            document = rows[position * step + 1] if include_result else None
+            entry = _compact_status(values, document, include_result)
+            if entry is None:
+                missing.append(task_id)
+            statuses[task_id] = entry or {"status": "not_found"}
+        
+        if missing and task_archive.enabled:
+            archived = await run_in_threadpool(task_archive.load_many, missing)
+            for task_id, document in archived.items():
+                task_data = json.loads(document)
+                entry = {"status": task_data.get("status", "completed")}
+                if include_result:
+                    entry["result"] = task_data.get("result")
+                statuses[task_id] = entry
+        
+        return statuses
+
+    async def register_task(self, task_id: str, task_type: str, user_id: Optional[str] = None):
+        """
+        Record a freshly enqueued task as queued and index it under its user
+
+        Indexed tasks are announced on the user's event stream so connections
+        following every task of a user pick them up as they are created.
+        """
+        pipe = self.client.pipeline()
+        fields = {"type": task_type}
+        if user_id:
+            fields["user_id"] = user_id
+        pipe.hset(task_key(task_id), mapping=fields)
+        _queue_write(pipe, task_id, "queued")
+        
+        if user_id:
+            index_key = user_tasks_key(user_id)
+            pipe.zadd(index_key, {task_id: time.time()})
+            pipe.zremrangebyrank(index_key, 0, -(USER_INDEX_MAX + 1))
+            pipe.expire(index_key, STATUS_TTLS["completed"])
+            _queue_stream_append(
+                pipe,
+                user_events_key(user_id),
+                "task",
+                {"task_id": task_id, "type": task_type},
+                STATUS_TTLS["completed"]
+            )
+        await pipe.execute()
+
+    async def get_user_task_ids(self, user_id: str) -> List[str]:
+        """Get the IDs of a user's most recent tasks, newest first"""
+        task_ids = await self.client.zrevrange(user_tasks_key(user_id), 0, USER_INDEX_MAX - 1)
+        return [_text(task_id) for task_id in task_ids]
+
+    async def latest_event_id(self, key: str) -> str:
+        """Get the ID of the newest entry in an event stream, or 0-0 if it's empty"""
+        entries = await self.client.xrevrange(key, count=1)
+        return _text(entries[0][0]) if entries else "0-0"
+
+    async def read_streams(self, cursors: Dict[str, str], block_ms: Optional[int] = None, count: int = 100) -> List[Tuple[str, str, str, Dict[str, Any]]]:
+        """
+        Read events appended to several streams after their cursor IDs
+
+        With block_ms set this waits up to that long for new events, so
+        callers get pushed events without polling.
+        """
+        response = await self.client.xread(cursors, count=count, block=block_ms)
+        return _parse_events(response)
+
+    async def read_events(self, task_id: str, last_id: str = "0-0", block_ms: Optional[int] = None, count: int = 100) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """Read events appended to the task's stream after last_id"""
+        events = await self.read_streams({task_events_key(task_id): last_id}, block_ms=block_ms, count=count)
+        return [(entry_id, event, data) for _, entry_id, event, data in events]
+
+async def get_task_store(redis_client: aioredis.Redis = Depends(get_redis)) -> AsyncTaskStateStore:
+    """FastAPI dependency returning a task store on the shared Redis pool"""
+    return AsyncTaskStateStore(redis_client)
+
+# Create a singleton instance for the workers
+task_store = TaskStateStore()
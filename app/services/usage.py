@@ -0,0 +1,194 @@
+import contextvars
+import json
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import Depends
+from pydantic_ai.messages import ModelRequest, RetryPromptPart
+from redis import Redis
+from redis import asyncio as aioredis
+
+from app.core.config import settings
+from app.core.redis import create_sync_redis, get_redis
+from app.services.task_store import STATUS_TTLS, task_key, task_usage_key
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Prefix of the usage fields kept on each task's usage hash
+TASK_USAGE_PREFIX = "usage:"
+# Prefix of the per-agent cascade paths kept on each task's usage hash
+CASCADE_PREFIX = "cascade:"
+# A task's usage is kept as long as its record can be, so it never outlives it for long
+TASK_USAGE_TTL = max(STATUS_TTLS.values())
+# Daily aggregates are kept this long so spend can be compared before and after a change
+DAILY_USAGE_TTL = 90 * 24 * 60 * 60
+USAGE_DIMENSIONS = ("type", "user", "model")
+
+def usage_key(dimension: str, name: str, day: Optional[str] = None) -> str:
+    """Redis hash of usage counters for one task type, user or model, optionally for one UTC day"""
+    if day:
+        return f"usage:{day}:{dimension}:{name}"
+    return f"usage:{dimension}:{name}"
+
+def usage_index_key(dimension: str) -> str:
+    """Set of the names seen for a dimension, so aggregates can be listed"""
+    return f"usage:index:{dimension}"
+
+# Tasks currently running in this thread, outermost first; nested tasks
+# (a recipe's inline sales page extraction) count towards their parents too
+_scopes: contextvars.ContextVar[Tuple[Dict[str, Optional[str]], ...]] = contextvars.ContextVar("usage_scopes", default=())
+
+@contextmanager
+def usage_scope(task_id: str, task_type: Optional[str], user_id: Optional[str] = None) -> Iterator[None]:
+    """Attribute model usage recorded inside the block to this task"""
+    token = _scopes.set(_scopes.get() + ({"task_id": task_id, "task_type": task_type, "user_id": user_id},))
+    try:
+        yield
+    finally:
+        _scopes.reset(token)
+
+def summarize_run(result: Any, wall_time: float) -> Dict[str, float]:
+    """Usage counters of one pydantic-ai agent run"""
+    usage = result.usage()
+    retries = sum(
+        1
+        for message in result.all_messages() if isinstance(message, ModelRequest)
+        for part in message.parts if isinstance(part, RetryPromptPart)
+    )
+    return {
+        "requests": usage.requests or 0,
+        "input_tokens": usage.request_tokens or 0,
+        "output_tokens": usage.response_tokens or 0,
+        "cached_tokens": (usage.details or {}).get("cached_tokens", 0),
+        "retries": retries,
+        "wall_time": wall_time,
+    }
+
+def estimate_cost(model: str, usage: Dict[str, float]) -> float:
+    """Estimated cost in USD from MODEL_PRICES (per million tokens); unknown models cost 0"""
+    prices = settings.MODEL_PRICES.get(model)
+    if not prices:
+        return 0.0
+    cached = usage.get("cached_tokens", 0)
+    uncached = max(usage.get("input_tokens", 0) - cached, 0)
+    return (
+        uncached * prices.get("input", 0)
+        + cached * prices.get("cached_input", prices.get("input", 0))
+        + usage.get("output_tokens", 0) * prices.get("output", 0)
+    ) / 1_000_000
+
+class UsageTracker:
+    """
+    Records token, latency and cost counters for every model call
+
+    Each call is added to the metadata hash of every task in the current
+    usage scope, and to running and daily totals per task type, user and model.
+    """
+
+    def __init__(self, client: Optional[Redis] = None):
+        self.client = client or create_sync_redis()
+
+    def record(self, agent_name: str, model: str, usage: Dict[str, float]):
+        """Record one agent call; never raises"""
+        counters = {name: value for name, value in usage.items() if value}
+        counters["calls"] = 1
+        counters["cost_usd"] = estimate_cost(model, usage)
+
+        try:
+            self._add(counters, model=model)
+        except Exception as e:
+            logger.warning(f"Error recording usage for {agent_name}: {str(e)}")
+
+    def record_page(self, counters: Dict[str, float]):
+        """Record page condensation counters (tokens before and after); never raises"""
+        try:
+            self._add(counters)
+        except Exception as e:
+            logger.warning(f"Error recording page usage: {str(e)}")
+
+    def _add(self, counters: Dict[str, float], model: Optional[str] = None):
+        """Add counters to every task in scope and to the per-type, user and model totals"""
+        scopes = _scopes.get()
+        task_type = (scopes[-1]["task_type"] if scopes else None) or "untracked"
+        user_id = next((scope["user_id"] for scope in reversed(scopes) if scope["user_id"]), None)
+        names = {"type": task_type}
+        if model:
+            names["model"] = model
+        if user_id:
+            names["user"] = user_id
+
+        day = time.strftime("%Y-%m-%d", time.gmtime())
+        pipe = self.client.pipeline(transaction=False)
+        for scope in scopes:
+            for field, value in counters.items():
+                pipe.hincrbyfloat(task_usage_key(scope["task_id"]), f"{TASK_USAGE_PREFIX}{field}", value)
+            pipe.expire(task_usage_key(scope["task_id"]), TASK_USAGE_TTL)
+        for dimension, name in names.items():
+            pipe.sadd(usage_index_key(dimension), name)
+            for key in (usage_key(dimension, name), usage_key(dimension, name, day)):
+                for field, value in counters.items():
+                    pipe.hincrbyfloat(key, field, value)
+            pipe.expire(usage_key(dimension, name, day), DAILY_USAGE_TTL)
+        pipe.execute()
+
+    def record_cascade(self, agent_name: str, path: List[Dict[str, Any]]):
+        """Store the models an agent tried, and their outcomes, on the innermost running task"""
+        scopes = _scopes.get()
+        if not scopes:
+            return
+        key = task_usage_key(scopes[-1]["task_id"])
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hset(key, f"{CASCADE_PREFIX}{agent_name}", json.dumps(path))
+            pipe.expire(key, TASK_USAGE_TTL)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Error recording cascade path for {agent_name}: {str(e)}")
+
+# Create a singleton instance
+usage_tracker = UsageTracker()
+
+def _parse_counters(record: Dict[bytes, bytes], prefix: str = "") -> Dict[str, float]:
+    counters = {}
+    for field, value in record.items():
+        field = field.decode("utf-8") if isinstance(field, bytes) else field
+        if field.startswith(prefix):
+            counters[field[len(prefix):]] = float(value)
+    return counters
+
+class AsyncUsageReader:
+    """Reads recorded usage for the API"""
+
+    def __init__(self, client: aioredis.Redis):
+        self.client = client
+
+    async def get_task_usage(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Usage counters and cascade paths stored for a task, or None if the task isn't in Redis"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hgetall(task_usage_key(task_id))
+        pipe.exists(task_key(task_id))
+        record, exists = await pipe.execute()
+        if not record and not exists:
+            return None
+        cascades = {}
+        for field, value in record.items():
+            field = field.decode("utf-8")
+            if field.startswith(CASCADE_PREFIX):
+                cascades[field[len(CASCADE_PREFIX):]] = json.loads(value)
+        return {"usage": _parse_counters(record, TASK_USAGE_PREFIX), "cascade": cascades}
+
+    async def get_totals(self, dimension: str, day: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """Usage counters for every name seen in a dimension, overall or for one UTC day"""
+        names = sorted(name.decode("utf-8") for name in await self.client.smembers(usage_index_key(dimension)))
+        pipe = self.client.pipeline(transaction=False)
+        for name in names:
+            pipe.hgetall(usage_key(dimension, name, day))
+        records: List[Dict[bytes, bytes]] = await pipe.execute()
+        return {name: _parse_counters(record) for name, record in zip(names, records) if record}
+
+async def get_usage_reader(redis_client: aioredis.Redis = Depends(get_redis)) -> AsyncUsageReader:
+    """FastAPI dependency returning a usage reader on the shared pool"""
+    return AsyncUsageReader(redis_client)
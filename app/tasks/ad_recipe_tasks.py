@@ -1,58 +1,59 @@
 import json
-import asyncio
-import nest_asyncio
-from celery import Task
 from pydantic_ai import Agent, ImageUrl
 from pydantic_ai.exceptions import UnexpectedModelBehavior
 import logging
-from redis import Redis
 
 from app.core.celery_app import celery_app
 from app.core.config import settings
-from app.models.common import TaskResult
+from app.services.task_store import task_store
+from app.tasks.base import TrackedTask
 from app.models.ad_concept import AdConceptOutput
 from app.models.sales_page import SalesPageOutput
+from app.services.sales_page_cache import sales_page_cache
 from app.services.supabase_service import supabase_service
-from app.tasks.ad_analysis_workflow import analyze_ad_with_structured_workflow
+from app.tasks.ad_concept_tasks import analyze_ad_cached
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Redis client
-redis_client = Redis(
-    host=settings.REDIS_HOST,
-    port=settings.REDIS_PORT,
-    db=settings.REDIS_DB,
-    socket_timeout=5,
-    socket_connect_timeout=5,
-    retry_on_timeout=True,
-    decode_responses=True
-)
-
-# Apply nest_asyncio to make asyncio play nice in Celery tasks
-nest_asyncio.apply()
-
 celery_app.conf.task_routes = {
     "app.tasks.ad_concept_tasks.*": {"queue": "ad-concept"},
     "app.tasks.sales_page_tasks.*": {"queue": "sales-page"},
     "app.tasks.ad_recipe_tasks.*": {"queue": "ad-recipe"},
 }
 
-class AdRecipeTask(Task):
+# Steps of a recipe generation, in order, as reported in progress events
+RECIPE_STEPS = [
+    "sales_page_extraction",
+    "concept_lookup",
+    "concept_generation",
+    "prompt_build",
+    "recipe_store",
+]
+
+class AdRecipeTask(TrackedTask):
     """Base task for ad recipe generation"""
     
+    task_type = "ad-recipe"
+    
     def update_state(self, task_id, status, result=None, error=None):
-        """Update task state in Redis"""
-        task_data = TaskResult(
-            status=status,
-            result=result,
-            error=error
-        ).model_dump()
-        redis_client.set(f"task:{task_id}", json.dumps(task_data))
+        """Update task state in Redis and publish it to stream subscribers"""
+        task_store.update(task_id, status, result=result, error=error)
+    
+    def report_progress(self, task_id, step, state="started", **details):
+        """Append a progress event for one of the recipe steps"""
+        task_store.add_progress(
+            task_id,
+            step,
+            RECIPE_STEPS.index(step) + 1,
+            len(RECIPE_STEPS),
+            state=state,
+            details=details
+        )
 
 @celery_app.task(base=AdRecipeTask, bind=True, name="app.tasks.ad_recipe_tasks.generate_ad_recipe")
-def generate_ad_recipe(self, ad_archive_id: str, image_url: str, sales_url: str, user_id: str, task_id: str):
+def generate_ad_recipe(self, ad_archive_id: str, image_url: str, sales_url: str, user_id: str, task_id: str, bypass_cache: bool = False):
     """
     Generate an ad recipe by combining ad concept and sales page data
     
@@ -62,6 +63,7 @@ def generate_ad_recipe(self, ad_archive_id: str, image_url: str, sales_url: str,
         sales_url: URL of the sales page to analyze
         user_id: ID of the user making the request
         task_id: Unique ID for tracking the task
+        bypass_cache: Skip cached model results and refresh them
     """
     # Update task status to "processing"
     self.update_state(task_id, "processing")
@@ -70,26 +72,41 @@ def generate_ad_recipe(self, ad_archive_id: str, image_url: str, sales_url: str,
     try:
         # Step 1: Extract sales page information
         logger.info(f"Step 1: Extracting sales page information for {sales_url}")
-        sales_page_task_id = f"{task_id}_sales"
-        
-        # Import at runtime to avoid circular import
-        from app.tasks.sales_page_tasks import extract_sales_page
+        self.report_progress(task_id, "sales_page_extraction")
         
-        # Run sales page extraction task synchronously
-        sales_result = extract_sales_page(sales_url, sales_page_task_id)
+        # Known pages are served from the cache, stale ones while a refresh runs in the background
+        sales_page_json, cache_state = (None, None) if bypass_cache else sales_page_cache.get(sales_url)
+        if cache_state == "stale" and sales_page_cache.claim_refresh(sales_url):
+            # Import at runtime to avoid circular import
+            from app.tasks.sales_page_tasks import refresh_sales_page
+            refresh_sales_page.delay(sales_url)
         
-        # Check if the task was successful
-        sales_task_data = json.loads(redis_client.get(f"task:{sales_page_task_id}"))
-        if sales_task_data.get("status") != "completed":
-            logger.error(f"Failed to extract sales page data: {sales_task_data.get('error')}")
-            raise Exception(f"Failed to extract sales page data: {sales_task_data.get('error')}")
+        if sales_page_json is None:
+            # Only a cold miss waits on the model
+            sales_page_task_id = f"{task_id}_sales"
+            
+            # Import at runtime to avoid circular import
+            from app.tasks.sales_page_tasks import extract_sales_page
+            
+            # Run sales page extraction task synchronously
+            sales_result = extract_sales_page(sales_url, sales_page_task_id, bypass_cache=bypass_cache)
+            
+            # Check if the task was successful
+            sales_task_data = task_store.get(sales_page_task_id) or {}
+            if sales_task_data.get("status") != "completed":
+                logger.error(f"Failed to extract sales page data: {sales_task_data.get('error')}")
+                raise Exception(f"Failed to extract sales page data: {sales_task_data.get('error')}")
+            
+            # Get the sales page result
+            sales_page_json = sales_task_data.get("result")
+            cache_state = "miss"
         
-        # Get the sales page result
-        sales_page_json = sales_task_data.get("result")
         logger.info(f"Successfully extracted sales page data with {len(sales_page_json) if isinstance(sales_page_json, dict) else 0} fields")
+        self.report_progress(task_id, "sales_page_extraction", "completed", cache=cache_state)
         
         # Step 2: Check if we need to generate a new ad concept
         logger.info(f"Step 2: Checking if ad concept exists for {ad_archive_id}")
+        self.report_progress(task_id, "concept_lookup")
         ad_concept_data = supabase_service.get_ad_concept_by_archive_id(ad_archive_id)
         should_generate_new_concept = False
         
@@ -112,18 +129,16 @@ def generate_ad_recipe(self, ad_archive_id: str, image_url: str, sales_url: str,
             logger.info(f"No existing ad concept found for {ad_archive_id}")
             should_generate_new_concept = True
         
+        self.report_progress(task_id, "concept_lookup", "completed", found=not should_generate_new_concept)
+        
         # Generate a new concept if needed using the structured workflow
         if should_generate_new_concept:
             logger.info(f"Generating new ad concept using structured workflow")
-            
-            # Create an event loop for the async workflow
-            loop = asyncio.get_event_loop()
+            self.report_progress(task_id, "concept_generation")
             
             # Run the structured workflow analysis
             logger.info(f"Starting structured ad analysis workflow for {image_url}")
-            ad_concept_json = loop.run_until_complete(
-                analyze_ad_with_structured_workflow(image_url, sales_page_json)
-            )
+            ad_concept_json = analyze_ad_cached(image_url, sales_page_json, bypass_cache=bypass_cache)
             
             logger.info(f"Successfully generated ad concept with structured workflow")
             logger.info(f"Ad concept title: '{ad_concept_json.get('title')}'")
@@ -132,9 +147,13 @@ def generate_ad_recipe(self, ad_archive_id: str, image_url: str, sales_url: str,
             # Store the new concept in Supabase
             logger.info(f"Storing new ad concept in Supabase")
             supabase_service.store_ad_concept(ad_archive_id, image_url, ad_concept_json, user_id)
+            self.report_progress(task_id, "concept_generation", "completed")
+        else:
+            self.report_progress(task_id, "concept_generation", "skipped")
         
         # Step 3: Generate the recipe prompt
         logger.info(f"Step 3: Generating ad recipe prompt")
+        self.report_progress(task_id, "prompt_build")
         
         # Final validation before generating the recipe
         if not isinstance(ad_concept_json, dict):
@@ -226,9 +245,11 @@ The user will provide:
 Your goal is to make an ad that looks like it was created by the same designer who made the original ad, following the exact same creative approach, but featuring the user's product instead.
 """
         logger.info(f"Recipe prompt created, length: {len(recipe_prompt)} characters")
+        self.report_progress(task_id, "prompt_build", "completed", prompt_length=len(recipe_prompt))
 
         # Step 4: Store the complete recipe in Supabase
         logger.info(f"Step 4: Storing ad recipe in Supabase")
+        self.report_progress(task_id, "recipe_store")
         supabase_service.store_ad_recipe(
             ad_archive_id=ad_archive_id,
             image_url=image_url,
@@ -238,6 +259,7 @@ Your goal is to make an ad that looks like it was created by the same designer w
             recipe_prompt=recipe_prompt,
             user_id=user_id
         )
+        self.report_progress(task_id, "recipe_store", "completed")
         
         # Step 5: Update task status to "completed"
         logger.info(f"Step 5: Completing task {task_id}")
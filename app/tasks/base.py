@@ -0,0 +1,23 @@
+import inspect
+from typing import Optional
+
+from celery import Task
+
+from app.services.task_store import task_store
+from app.services.usage import usage_scope
+
+class TrackedTask(Task):
+    """Base task whose model usage is attributed to its task_id, task type and user"""
+    
+    task_type: Optional[str] = None
+    
+    def __call__(self, *args, **kwargs):
+        arguments = inspect.signature(self.run).bind_partial(*args, **kwargs).arguments
+        task_id = arguments.get("task_id")
+        if task_id is None:
+            return super().__call__(*args, **kwargs)
+        
+        # The API records the user when it registers the task
+        user_id = arguments.get("user_id") or task_store.get_user_id(task_id)
+        with usage_scope(task_id, self.task_type, user_id=user_id):
+            return super().__call__(*args, **kwargs)
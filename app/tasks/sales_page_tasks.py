@@ -1,35 +1,28 @@
 import json
-import asyncio
-import nest_asyncio
-from celery import Task
-from pydantic_ai import Agent, RunContext, ModelRetry
+from pydantic_ai import RunContext, ModelRetry
 from pydantic_ai.exceptions import UnexpectedModelBehavior
 import logging
-from redis import Redis
 import os
+from typing import Any, Dict, Optional
 from app.core.celery_app import celery_app
 from app.core.config import settings
 from app.models.sales_page import SalesPageOutput
-from app.models.common import TaskResult
+from app.services.agents import agent_registry
+from app.services.page_fetcher import FetchedPage, PageFetchError, conditional_headers, page_fetcher
+from app.services.page_condenser import chunk_text, condense_page
+from app.services.page_parser import ParsedPage, parse_page
+from app.services.sales_page_cache import sales_page_cache, sales_page_cache_key
+from app.services.sales_page_merge import merge_sales_page_chunks
+from app.services.structured_data import combine_with_narrative, extract_structured_fields, has_fast_path, needs_social_proof
+from app.services.single_flight import single_flight
+from app.services.task_store import task_store
+from app.services.usage import usage_tracker
+from app.tasks.base import TrackedTask
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Redis client
-redis_client = Redis(
-    host=settings.REDIS_HOST,
-    port=settings.REDIS_PORT,
-    db=settings.REDIS_DB,
-    socket_timeout=5,
-    socket_connect_timeout=5,
-    retry_on_timeout=True,
-    decode_responses=True
-)
-
-# Apply nest_asyncio to make asyncio play nice in Celery tasks
-nest_asyncio.apply()
-
 celery_app.conf.task_routes = {
     "app.tasks.ad_concept_tasks.*": {"queue": "ad-concept"},
     "app.tasks.sales_page_tasks.*": {"queue": "sales-page"},
@@ -41,95 +34,165 @@ celery_app.conf.update(
     broker_connection_retry_on_startup=True,
 )
 
-class SalesPageTask(Task):
+def fetch_page(page_url: str, validators: Optional[Dict[str, str]] = None) -> Optional[FetchedPage]:
+    """Download (or revalidate) a sales page; None if it can't be fetched"""
+    try:
+        return page_fetcher.fetch_sync(page_url, headers=conditional_headers(validators or {}))
+    except (PageFetchError, TimeoutError) as e:
+        logger.warning(f"Could not fetch {page_url}: {str(e)}")
+        return None
+
+def build_sales_page_prompt(page_url: str, page_text: str) -> str:
+    """The extraction prompt, grounded in the page text when there is some"""
+    if not page_text:
+        return f"Analyze the sales page at this URL: {page_url} and extract information in the exact JSON format specified."
+    return (
+        f"Analyze the sales page at this URL: {page_url} and extract information in the exact JSON format specified. "
+        "Use only the page content below; leave fields empty when the page doesn't say.\n\n"
+        f"PAGE CONTENT:\n{page_text}"
+    )
+
+def extract_in_chunks(page_url: str, page: ParsedPage, bypass_cache: bool = False) -> SalesPageOutput:
+    """
+    Map-reduce extraction for pages too long for one budgeted prompt
+
+    The page is condensed to SALES_PAGE_MAX_CHUNKS chunks' worth, each chunk
+    is extracted concurrently, and the partial outputs are merged locally.
+    """
+    condensed = condense_page(page, budget=settings.SALES_PAGE_CHUNK_TOKENS * settings.SALES_PAGE_MAX_CHUNKS)
+    chunks = chunk_text(condensed.text, settings.SALES_PAGE_CHUNK_TOKENS)
+    logger.info(f"Extracting {page_url} in {len(chunks)} chunks ({condensed.tokens_before} to {condensed.tokens_after} tokens)")
+    usage_tracker.record_page({**condensed.stats(), "page_chunks": len(chunks)})
+
+    # The first chunk opens with the page title; the others are given it too
+    header = f"Title: {page.title}\n" if page.title else ""
+    prompts = [build_sales_page_prompt(page_url, chunk if index == 0 else header + chunk) for index, chunk in enumerate(chunks)]
+    outputs = [output for output in agent_registry.run_many("sales_page_chunk", prompts, bypass_cache=bypass_cache) if output is not None]
+    if not outputs:
+        raise RuntimeError(f"Every chunk of {page_url} failed to extract")
+    return merge_sales_page_chunks(outputs, fallback_name=page.title)
+
+def extract_with_structured_data(page_url: str, fields: Dict[str, Any], page_text: str, bypass_cache: bool = False) -> SalesPageOutput:
+    """Ask the model only for the narrative fields, given what structured data already says"""
+    # Ratings and reviews from structured data stand in for the social proof in the copy
+    social_proof = "Also extract social_proof." if needs_social_proof(fields) else "Leave social_proof out."
+    prompt = (
+        f"Analyze the sales page for {fields['product_name']} at this URL: {page_url} and extract the narrative fields "
+        f"in the exact JSON format specified. {social_proof}\n\n"
+        f"PAGE CONTENT:\n{page_text}"
+    )
+    narrative = agent_registry.run("sales_page_narrative", prompt, bypass_cache=bypass_cache)
+    return combine_with_narrative(fields, narrative)
+
+def extract_page(page_url: str, page: Optional[ParsedPage], bypass_cache: bool = False) -> SalesPageOutput:
+    """
+    Run the model on a parsed page
+
+    Pages whose structured data names the product and its price only need the
+    narrative fields from the model; other pages are extracted in full,
+    condensed or in chunks depending on their length.
+    """
+    condensed = condense_page(page) if page else None
+    fields = extract_structured_fields(page) if page and settings.SALES_PAGE_STRUCTURED_FAST_PATH else {}
+    if has_fast_path(fields):
+        logger.info(f"Using structured data of {page_url} for {', '.join(sorted(fields))}")
+        usage_tracker.record_page({**condensed.stats(), "page_structured": 1})
+        return extract_with_structured_data(page_url, fields, condensed.text, bypass_cache=bypass_cache)
+    if condensed and condensed.tokens_before > settings.SALES_PAGE_MAP_REDUCE_THRESHOLD:
+        return extract_in_chunks(page_url, page, bypass_cache=bypass_cache)
+    if condensed:
+        logger.info(
+            f"Condensed {page_url} from {condensed.tokens_before} to {condensed.tokens_after} tokens "
+            f"({condensed.sections_kept}/{condensed.sections_total} sections)"
+        )
+        usage_tracker.record_page(condensed.stats())
+    prompt = build_sales_page_prompt(page_url, condensed.text if condensed else "")
+    # Agents are built once per worker process; identical pages are served from the LLM cache
+    return agent_registry.run("sales_page", prompt, bypass_cache=bypass_cache)
+
+def run_sales_page_extraction(page_url: str, bypass_cache: bool = False, revalidate: bool = True) -> dict:
+    """
+    Extract a sales page and keep the result in the sales page cache
+
+    With revalidate, a page extracted before is fetched conditionally with
+    its stored ETag and Last-Modified. On a 304, or if its content hash is
+    unchanged, the stored extraction is kept and no model is called; if the
+    content changed the entry is marked stale and the page re-extracted. If
+    the page can't be fetched, the stored extraction is returned as-is.
+
+    Concurrent extractions of one page (by normalized URL) across workers
+    share a single fetch and extraction; coalescing only the model calls
+    would still fetch the page once per caller, and pages that differ on
+    every download (stock counters, timers) would never share a prompt.
+    """
+    def extract() -> dict:
+        return _extract_and_cache(page_url, bypass_cache=bypass_cache, revalidate=revalidate)
+
+    if settings.SINGLE_FLIGHT_ENABLED:
+        return single_flight.do(sales_page_cache_key(page_url), extract, bypass=bypass_cache)
+    return extract()
+
+def _extract_and_cache(page_url: str, bypass_cache: bool = False, revalidate: bool = True) -> dict:
+    cached = sales_page_cache.get_entry(page_url) if revalidate else None
+    validators = cached.get("validators", {}) if cached else {}
+    fetched = fetch_page(page_url, validators)
+
+    if cached and fetched and fetched.not_modified:
+        logger.info(f"{page_url} not modified, keeping its extraction")
+        sales_page_cache.revalidated(page_url, cached, fetched.validators())
+        usage_tracker.record_page({"page_revalidated": 1})
+        return cached["data"]
+
+    page = parse_page(fetched.html) if fetched and not fetched.not_modified else None
+    if cached and page is None:
+        # A grounded extraction beats one guessed from the URL; it stays stale so it's retried later
+        logger.warning(f"Could not revalidate {page_url}, keeping its cached extraction")
+        return cached["data"]
+    new_validators = {**fetched.validators(), "content_hash": page.content_hash()} if page else {}
+    if cached and page:
+        if new_validators["content_hash"] == validators.get("content_hash"):
+            logger.info(f"{page_url} content unchanged, keeping its extraction")
+            sales_page_cache.revalidated(page_url, cached, new_validators)
+            usage_tracker.record_page({"page_revalidated": 1})
+            return cached["data"]
+        # Readers see the old extraction as stale until this one is stored
+        sales_page_cache.mark_changed(page_url, cached)
+        usage_tracker.record_page({"page_changed": 1})
+
+    result_dict = extract_page(page_url, page, bypass_cache=bypass_cache).model_dump()
+    sales_page_cache.set(page_url, result_dict, new_validators)
+    return result_dict
+
+class SalesPageTask(TrackedTask):
     """Base task for sales page extraction"""
     
+    task_type = "sales-page"
+    
     def update_state(self, task_id, status, result=None, error=None):
-        """Update task state in Redis"""
-        task_data = TaskResult(
-            status=status,
-            result=result,
-            error=error
-        ).model_dump()
-        redis_client.set(f"task:{task_id}", json.dumps(task_data))
+        """Update task state in Redis and publish it to stream subscribers"""
+        task_store.update(task_id, status, result=result, error=error)
 
 @celery_app.task(base=SalesPageTask, bind=True, name="app.tasks.sales_page_tasks.extract_sales_page")
-def extract_sales_page(self, page_url: str, task_id: str):
+def extract_sales_page(self, page_url: str, task_id: str, bypass_cache: bool = False):
     """
     Process a sales page extraction request and store the result in Redis
     
     Args:
         page_url: URL of the sales page to analyze
         task_id: Unique ID for tracking the task
+        bypass_cache: Skip cached model results and refresh them
     """
     # Update task status to "processing"
     self.update_state(task_id, "processing")
 
     try:
-        # Define a fully self-contained async function
-        async def process_with_agent():
-            # Create a new agent for this task
-            agent = Agent(
-                "openai:gpt-4o",
-                result_type=SalesPageOutput,
-                system_prompt="""You are an expert marketing assistant. Analyze the following sales page and extract all the essential information needed for an advertiser to create effective Facebook ad creatives. Organize the information into a structured JSON format.
-
-Your analysis MUST include these fields in JSON format:
-- product_name: The name of the product (required)
-- tagline: Main tagline or slogan
-- key_benefits: Array of key benefits of the product
-- features: Array of product features
-- problem_addressed: Problem the product addresses
-- target_audience: Target audience description
-- social_proof: Object containing testimonials (array), media_mentions (array), and sales_numbers (string)
-- offer: Object containing discount, limited_time_offer, shipping, and guarantee details
-- call_to_action: Call to action text
-- visual_elements_to_include: Array of visual elements to include in ads
-- brand_voice: Brand voice description
-- compliance_notes: Any compliance or legal considerations
-
-The output JSON MUST match this structure:
-{
-  "product_name": "Example Product",
-  "tagline": "Revolutionize Your Experience",
-  "key_benefits": ["Benefit 1", "Benefit 2", "Benefit 3"],
-  "features": ["Feature 1", "Feature 2", "Feature 3"],
-  "problem_addressed": "Description of the problem this product solves",
-  "target_audience": "Description of the target audience",
-  "social_proof": {
-    "testimonials": ["Testimonial 1", "Testimonial 2"],
-    "media_mentions": ["Media mention 1", "Media mention 2"],
-    "sales_numbers": "Over 10,000 satisfied customers"
-  },
-  "offer": {
-    "discount": "20% off",
-    "limited_time_offer": "Only available until Friday",
-    "shipping": "Free shipping worldwide",
-    "guarantee": "30-day money-back guarantee"
-  },
-  "call_to_action": "Get yours today",
-  "visual_elements_to_include": ["Product image", "Customer testimonial image", "Before/after comparison"],
-  "brand_voice": "Professional but approachable, emphasizes expertise",
-  "compliance_notes": "Must include disclaimer about results varying by individual"
-}
-
-Be comprehensive and identify all marketing elements that would be useful for creating compelling ads.
-"""
-            )
-            
-            # Process the sales page
-            result = await agent.run(f"Analyze the sales page at this URL: {page_url} and extract information in the exact JSON format specified.")
-            
-            return result
+        # A bypass re-extracts even an unchanged page
+        result_dict = run_sales_page_extraction(page_url, bypass_cache=bypass_cache, revalidate=not bypass_cache)
         
-        # Create a new event loop and run the async function
-        loop = asyncio.get_event_loop()
-        result = loop.run_until_complete(process_with_agent())
+        # Log the result
+        logger.info(f"Final result data ({task_id}): {json.dumps(result_dict, indent=2)}")
         
         # Store the successful result
-        result_dict = result.data.model_dump()
-         # Log the result
-        logger.info(f"Final result data ({task_id}): {json.dumps(result.data.model_dump(), indent=2)}")
         self.update_state(
             task_id, 
             "completed", 
@@ -161,4 +224,21 @@ Be comprehensive and identify all marketing elements that would be useful for cr
             "task_id": task_id, 
             "error": str(e),
             "success": False
-        } 
\ No newline at end of file
+        }
+
+@celery_app.task(bind=True, name="app.tasks.sales_page_tasks.refresh_sales_page")
+def refresh_sales_page(self, page_url: str):
+    """
+    Re-extract a stale cached sales page in the background
+    
+    Args:
+        page_url: URL of the sales page to refresh
+    """
+    try:
+        # An unchanged page keeps its extraction; a changed one skips the LLM cache too
+        run_sales_page_extraction(page_url, bypass_cache=True)
+        logger.info(f"Refreshed cached sales page {page_url}")
+    except Exception as e:
+        logger.error(f"Error refreshing cached sales page {page_url}: {str(e)}")
+    finally:
+        sales_page_cache.release_refresh(page_url)
@@ -1,11 +1,19 @@
 import os
 
 from app.core.celery_app import celery_app
+from app.core.config import settings
 
 # Make sure all tasks are imported for Celery to discover them
-from app.tasks.ad_concept_tasks import extract_ad_concept
+from app.tasks.ad_concept_tasks import extract_ad_concept_with_context
 from app.tasks.sales_page_tasks import extract_sales_page
+from app.tasks.ad_recipe_tasks import generate_ad_recipe
 
 if __name__ == "__main__":
-    # Run Celery worker
-    celery_app.worker_main(["worker", "--loglevel=info", "-Q", "ad-concept,sales-page"]) 
\ No newline at end of file
+    # Run Celery worker on every queue, WORKER_CONCURRENCY tasks at a time
+    celery_app.worker_main([
+        "worker",
+        "--loglevel=info",
+        "-Q", settings.WORKER_QUEUES,
+        "-P", settings.WORKER_POOL,
+        "-c", str(settings.WORKER_CONCURRENCY),
+    ])